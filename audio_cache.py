@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import discord
+from discord.oggparse import OggStream
+
+logger = logging.getLogger("discord")
+
+
+class LocalOpusAudio(discord.AudioSource):
+    """Plays an Ogg Opus file straight from disk, no ffmpeg process involved."""
+
+    FRAME_SECONDS = 0.02
+
+    def __init__(self, path, offset=0.0):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = self._packets = None
+        self.seek(offset)
+
+    @property
+    def position(self) -> float:
+        return self.frames * self.FRAME_SECONDS
+
+    def seek(self, offset):
+        # Reopens the file and skips the 20ms packets before ``offset``, safe while the voice client reads
+        file = open(self.path, "rb")
+        packets = OggStream(file).iter_packets()
+        frames = 0
+        for _ in range(int(offset / self.FRAME_SECONDS)):
+            if next(packets, None) is None:
+                break
+            frames += 1
+        with self._lock:
+            old, self._file, self._packets, self.frames = self._file, file, packets, frames
+        if old is not None:
+            old.close()
+
+    def read(self) -> bytes:
+        with self._lock:
+            data = next(self._packets, b"")
+            if data:
+                self.frames += 1
+            return data
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self):
+        with self._lock:
+            self._file.close()
+
+
+class AudioCache:
+    """Size-bounded LRU directory of encoded Opus files for frequently played tracks."""
+
+    def __init__(self, directory, max_bytes, play_threshold, ffmpeg, bitrate=96):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.play_threshold = play_threshold
+        self.ffmpeg = ffmpeg  # FFmpegSupervisor, encodes share its process cap and limits
+        self.bitrate = bitrate
+        self._storing = set()
+        self.counters = {"hits": 0, "stored": 0, "evictions": 0, "failed": 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "plays.db"))
+        self._db.execute("CREATE TABLE IF NOT EXISTS plays (id TEXT PRIMARY KEY, count INTEGER NOT NULL, last_played REAL NOT NULL)")
+        self._db.commit()
+
+    def path_for(self, video_id):
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_-]", "_", video_id) + ".opus")
+
+    def contains(self, video_id) -> bool:
+        return bool(video_id) and os.path.exists(self.path_for(video_id))
+
+    def open(self, video_id, offset=0.0):
+        path = self.path_for(video_id)
+        try:
+            # Touch the file so eviction sees it as recently used
+            os.utime(path)
+            source = LocalOpusAudio(path, offset)
+        except OSError:
+            return None
+        self.counters["hits"] += 1
+        return source
+
+    def record_play(self, video_id) -> bool:
+        # Returns True when the track just became popular enough to be stored
+        self._db.execute(
+            "INSERT INTO plays (id, count, last_played) VALUES (?, 1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET count = count + 1, last_played = excluded.last_played",
+            (video_id, time.time())
+        )
+        self._db.commit()
+        count = self._db.execute("SELECT count FROM plays WHERE id = ?", (video_id,)).fetchone()[0]
+        return count >= self.play_threshold and video_id not in self._storing and not self.contains(video_id)
+
+    async def store(self, track):
+        if not track.stream_url or track.id in self._storing:
+            return
+        self._storing.add(track.id)
+        path = self.path_for(track.id)
+        partial = path + ".part"
+        codec = "copy" if track.acodec == "opus" else "libopus"
+        try:
+            async with self.ffmpeg.subprocess(
+                "-hide_banner", "-loglevel", "error",
+                "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5",
+                "-i", track.stream_url, "-vn", "-map_metadata", "-1",
+                "-c:a", codec, "-ar", "48000", "-ac", "2", "-b:a", f"{self.bitrate}k", "-f", "opus", "-y", partial,
+                stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+                reason="audio_cache",
+            ) as process:
+                _, stderr = await process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(stderr.decode(errors="replace").strip() or f"ffmpeg exited with {process.returncode}")
+            os.replace(partial, path)
+            self.counters["stored"] += 1
+            logger.info(f"Cached audio for {track.title} ({os.path.getsize(path) // 1024} KiB).")
+        except Exception as e:
+            self.counters["failed"] += 1
+            logger.warning(f"Failed to cache audio for {track.title}: {e}")
+            if os.path.exists(partial):
+                os.remove(partial)
+        finally:
+            self._storing.discard(track.id)
+        self.evict()
+
+    def evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".opus"):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+            self.counters["evictions"] += 1
+
+    def stats(self) -> dict:
+        stats = dict(self.counters)
+        files = [name for name in os.listdir(self.directory) if name.endswith(".opus")]
+        stats["files"] = len(files)
+        stats["size_mb"] = round(sum(os.path.getsize(os.path.join(self.directory, name)) for name in files) / 1024 / 1024, 1)
+        return stats
+
+    def close(self):
+        self._db.close()
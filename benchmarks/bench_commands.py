@@ -0,0 +1,432 @@
+# End-to-end command benchmark without Discord or YouTube
+#
+#   python benchmarks/bench_commands.py                        # 20 guilds, 5 concurrent /play each
+#   python benchmarks/bench_commands.py --guilds 100 --requests 10 --extract-ms 800
+#
+# Drives the real /play, /queue and /skip callbacks from bot.py against fake Interaction and
+# VoiceClient objects. yt-dlp is replaced by a stand-in returning fixture info dicts whose stream
+# URLs point at a local HTTP server, so everything from the extraction pool to the ffmpeg source
+# and the GuildPlayer loop runs for real. Needs ffmpeg, no token or network.
+import argparse
+import asyncio
+import functools
+import http.server
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from types import SimpleNamespace
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # bot.py and embeds.py read config.json from the working directory
+os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+
+import yt_dlp
+
+import bot
+import cache
+import extractor
+import metrics
+import queue_store
+
+# discord.py sends one 20 ms Opus frame per iteration
+FRAME_SECONDS = 0.02
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def report(name, samples, unit="ms", scale=1000):
+    if not samples:
+        print(f"{name:<22} no samples")
+        return
+    print(
+        f"{name:<22} p50={percentile(samples, 0.5) * scale:9.2f}{unit}  p99={percentile(samples, 0.99) * scale:9.2f}{unit}  "
+        f"max={max(samples) * scale:9.2f}{unit}  mean={statistics.mean(samples) * scale:9.2f}{unit}  (n={len(samples)})"
+    )
+
+
+# Local audio server
+def make_test_track(ffmpeg, directory, seconds):
+    path = os.path.join(directory, "track.webm")
+    subprocess.run([
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-ac", "2", "-c:a", "libopus", "-b:a", "96k", path,
+    ], check=True)
+    return path
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_audio_server(directory):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, name="AudioServer", daemon=True).start()
+    return server
+
+
+# yt-dlp stand-in
+class FakeYoutubeDL:
+    """Answers ytsearch queries and watch URLs from fixture info dicts after a simulated network delay."""
+
+    fixtures = {}
+    latency = 0.3
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def extract_info(self, query, download=False):
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if query.startswith("ytsearch"):
+            text = query.split(":", 1)[1].strip()
+            ids = sorted(self.fixtures)
+            return {"_type": "playlist", "title": text, "webpage_url": None,
+                    "entries": [self.fixtures[ids[zlib.crc32(text.encode()) % len(ids)]]]}
+        video_id = query.rsplit("=", 1)[-1]
+        if video_id not in self.fixtures:
+            raise yt_dlp.utils.DownloadError(f"Unknown video {video_id}")
+        return self.fixtures[video_id]
+
+    def close(self):
+        pass
+
+
+def build_fixtures(count, stream_url, duration):
+    expire = int(time.time()) + 6 * 3600
+    fixtures = {}
+    for n in range(count):
+        video_id = f"bench{n:05d}"
+        fixtures[video_id] = {
+            "id": video_id,
+            "title": f"Benchmark track {n}",
+            "duration": duration,
+            "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+            "url": f"{stream_url}?id={video_id}&expire={expire}",
+            "acodec": "opus",
+        }
+    return fixtures
+
+
+# Discord stand-ins
+class PlaybackRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.startup = []  # voice_client.play() -> first packet
+        self.gaps = []     # last packet of a track -> first packet of the next one
+        self.late_frames = 0
+        self.packets = 0
+
+    def first_packet(self, started, previous_end):
+        now = time.perf_counter()
+        with self.lock:
+            self.startup.append(now - started)
+            if previous_end is not None:
+                self.gaps.append(now - previous_end)
+
+    def frame(self, late):
+        with self.lock:
+            self.packets += 1
+            self.late_frames += late
+
+
+class FakeVoiceClient:
+    """Paces source.read() like discord.py's AudioPlayer thread and calls after() when done."""
+
+    def __init__(self, channel, recorder):
+        self.channel = channel
+        self.guild = channel.guild
+        self.recorder = recorder
+        self._connected = True
+        self.source = None  # GuildPlayer.position() reads the frame count off the playing source
+        self._thread = None
+        self._end = threading.Event()
+        self._resumed = threading.Event()
+        self._last_packet_at = None
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self._thread is not None and self._thread.is_alive() and not self._end.is_set() and self._resumed.is_set()
+
+    def is_paused(self):
+        return self._thread is not None and self._thread.is_alive() and not self._end.is_set() and not self._resumed.is_set()
+
+    def play(self, source, *, after=None):
+        if self.is_playing():
+            raise RuntimeError("Already playing audio.")
+        self._end = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self.source = source
+        self._thread = threading.Thread(
+            target=self._run, args=(source, self._end, self._resumed, after, time.perf_counter()), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, source, end, resumed, after, started):
+        error = None
+        first = True
+        next_at = time.perf_counter()
+        try:
+            while not end.is_set():
+                if not resumed.is_set():
+                    resumed.wait()
+                    next_at = time.perf_counter()
+                    continue
+                data = source.read()
+                if not data:
+                    break
+                if first:
+                    self.recorder.first_packet(started, self._last_packet_at)
+                    first = False
+                next_at += FRAME_SECONDS
+                delay = next_at - time.perf_counter()
+                self.recorder.frame(late=delay < -FRAME_SECONDS)
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            error = e
+        finally:
+            # Like discord.py's AudioPlayer: no longer playing by the time after() runs
+            end.set()
+            self._last_packet_at = time.perf_counter()
+            source.cleanup()
+        if after is not None:
+            after(error)
+
+    def stop(self):
+        self._end.set()
+        self._resumed.set()
+        self.source = None
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+        self._connected = False
+        self._last_packet_at = None
+        if self.guild.voice_client is self:
+            self.guild.voice_client = None
+
+
+class FakeChannel:
+    def __init__(self, guild, recorder, connect_latency):
+        self.guild = guild
+        self.id = guild.id + 1
+        self.name = "General"
+        self.recorder = recorder
+        self.connect_latency = connect_latency
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(self.connect_latency)
+        self.guild.voice_client = FakeVoiceClient(self, self.recorder)
+        return self.guild.voice_client
+
+
+class FakeGuild:
+    def __init__(self, guild_id, recorder, connect_latency):
+        self.id = guild_id
+        self.name = f"Guild {guild_id}"
+        self.voice_client = None
+        self.channel = FakeChannel(self, recorder, connect_latency)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def send_message(self, *args, **kwargs):
+        self._done = True
+        self._interaction.replied_at = time.perf_counter()
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, *args, **kwargs):
+        self._interaction.replied_at = time.perf_counter()
+
+
+class FakeInteraction:
+    def __init__(self, guild, user_id):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = SimpleNamespace(id=user_id, name=f"user{user_id}", display_name=f"user{user_id}",
+                                    mention=f"<@{user_id}>", voice=SimpleNamespace(channel=guild.channel))
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.replied_at = None
+
+
+# Scenario
+class Latencies:
+    def __init__(self):
+        self.samples = {}
+        self.errors = 0
+
+    async def run(self, name, command, guild, *args):
+        interaction = FakeInteraction(guild, random.randint(1, 10**6))
+        start = time.perf_counter()
+        try:
+            await command.callback(interaction, *args)
+        except Exception as e:
+            self.errors += 1
+            print(f"/{name} failed in {guild.name}: {e!r}")
+            return
+        # Latency until the user sees the reply, not until the handler returns
+        end = interaction.replied_at or time.perf_counter()
+        self.samples.setdefault(name, []).append(end - start)
+
+
+async def guild_session(guild, latencies, args):
+    plays = [latencies.run("play", bot.play, guild, f"song {random.randrange(args.songs)}") for _ in range(args.requests)]
+    await asyncio.gather(*plays)
+
+    for _ in range(args.skips):
+        await asyncio.sleep(args.track_seconds * random.uniform(0.3, 0.7))
+        await latencies.run("queue", bot.queue, guild)
+        await latencies.run("skip", bot.skip, guild)
+
+    # Let the rest of the queue play out
+    guild_player = bot.PLAYERS.get(guild.id)
+    deadline = time.monotonic() + (args.requests + 2) * (args.track_seconds + 10)
+    while guild_player is not None and guild_player.state is not bot.PlayerState.IDLE and time.monotonic() < deadline:
+        task = guild_player._task
+        if task is not None and task.done():
+            break
+        await asyncio.sleep(0.2)
+
+    # A playback loop that died leaves the player stuck, count it instead of reporting a clean run
+    task = guild_player._task if guild_player is not None else None
+    if task is not None and task.done() and not task.cancelled() and task.exception() is not None:
+        latencies.errors += 1
+        print(f"player task failed in {guild.name}: {task.exception()!r}")
+
+
+async def scenario(args, recorder):
+    # Fresh pool and cache so every run starts cold; threads so the yt-dlp stand-in is used
+    bot.EXTRACTOR.close()
+    bot.EXTRACTOR = extractor.ExtractionService(workers=args.workers, use_processes=False, ydl_max_uses=0)
+    bot.SEARCH_CACHE.close()
+    bot.SEARCH_CACHE = cache.SearchCache(
+        os.path.join(args.tmp, "cache.db"),
+        memory_entries=bot.conf['cache']['memory_entries'],
+        metadata_ttl=bot.conf['cache']['metadata_ttl'],
+        stream_margin=bot.conf['cache']['stream_url_margin'],
+        default_stream_ttl=bot.conf['cache']['default_stream_ttl'],
+    )
+    # Fake guild queues must not end up in the real queues.db
+    if bot.QUEUE_STORE is not None:
+        bot.QUEUE_STORE.close()
+        bot.QUEUE_STORE = queue_store.QueueStore(os.path.join(args.tmp, "queues.db"))
+
+    async def change_presence(**kwargs):
+        pass
+    bot.bot.change_presence = change_presence
+
+    latencies = Latencies()
+    guilds = [FakeGuild(10**6 + n * 10, recorder, args.connect_ms / 1000) for n in range(args.guilds)]
+    lag = asyncio.create_task(metrics.monitor_loop_lag(0.05))
+    start = time.perf_counter()
+    await asyncio.gather(*(guild_session(guild, latencies, args) for guild in guilds))
+    elapsed = time.perf_counter() - start
+    lag.cancel()
+    bot.EXTRACTOR.close()
+    if bot.QUEUE_STORE is not None:
+        bot.QUEUE_STORE.close()
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5, help="concurrent /play requests per guild")
+    parser.add_argument("--skips", type=int, default=1, help="/queue + /skip rounds per guild")
+    parser.add_argument("--songs", type=int, default=50, help="distinct songs, fewer than requests means cache hits")
+    parser.add_argument("--track-seconds", type=int, default=4)
+    parser.add_argument("--extract-ms", type=float, default=300, help="simulated yt-dlp latency")
+    parser.add_argument("--connect-ms", type=float, default=150, help="simulated voice connect latency")
+    parser.add_argument("--workers", type=int, default=bot.conf['extraction']['workers'])
+    parser.add_argument("--ffmpeg", default=shutil.which("ffmpeg") or "ffmpeg")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not shutil.which(args.ffmpeg) and not os.path.exists(args.ffmpeg):
+        sys.exit(f"ffmpeg not found: {args.ffmpeg}")
+    random.seed(args.seed)
+    args.tmp = tempfile.mkdtemp(prefix="musicbot-bench-")
+
+    make_test_track(args.ffmpeg, args.tmp, args.track_seconds)
+    server = start_audio_server(args.tmp)
+    stream_url = f"http://127.0.0.1:{server.server_address[1]}/track.webm"
+
+    FakeYoutubeDL.fixtures = build_fixtures(args.songs, stream_url, args.track_seconds)
+    FakeYoutubeDL.latency = args.extract_ms / 1000
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+    bot.FFMPEG_EXECUTABLE = bot.FFMPEG.executable = args.ffmpeg
+
+    print(f"{args.guilds} guilds x {args.requests} concurrent /play, {args.songs} songs of {args.track_seconds}s, "
+          f"extraction {args.extract_ms:g}ms on {args.workers} workers")
+
+    recorder = PlaybackRecorder()
+    tracemalloc.start()
+    latencies, elapsed = asyncio.run(scenario(args, recorder))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    server.shutdown()
+
+    print()
+    for name in ("play", "queue", "skip"):
+        report(f"/{name}", latencies.samples.get(name, []))
+    report("first packet", recorder.startup)
+    report("transition gap", recorder.gaps)
+    for line in metrics.summary():
+        if line.startswith(("musicbot_track_load_seconds", "musicbot_event_loop_lag_seconds", "musicbot_extraction_seconds")):
+            print(f"  {line}")
+    print()
+    print(f"wall={elapsed:.1f}s  packets={recorder.packets}  late_frames={recorder.late_frames}  errors={latencies.errors}")
+    print("extraction: " + ", ".join(f"{k}={v}" for k, v in bot.EXTRACTOR.counters.items()))
+    print(f"python heap peak={peak / 1024 / 1024:.1f} MiB", end="")
+    if resource:
+        # ru_maxrss is KiB on Linux
+        print(f"  max rss={resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB", end="")
+    print()
+
+
+if __name__ == "__main__":
+    main()
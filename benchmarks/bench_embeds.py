@@ -0,0 +1,62 @@
+# Cost of building a command response embed: generic_embed directly vs. through a template
+#
+#   python benchmarks/bench_embeds.py
+#   python benchmarks/bench_embeds.py -n 200000
+#
+# Each variant ends with to_dict(), which is what discord.py serializes when the response is sent.
+import argparse
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # embeds.py reads config.json from the working directory
+
+import discord
+
+import embeds
+
+
+def fresh_static():
+    return embeds.generic_embed(
+        title=":x: Error",
+        description="I'm not connected to any voice channel.",
+        color=discord.Color.red()
+    ).to_dict()
+
+
+def template_static():
+    return embeds.from_template("not_connected").to_dict()
+
+
+def fresh_dynamic():
+    return embeds.generic_embed(
+        title=":wastebasket: Removed",
+        description="Removed **Some Song** from the queue.",
+        color=discord.Color.green()
+    ).to_dict()
+
+
+def template_dynamic():
+    return embeds.from_template("removed", description="Removed **Some Song** from the queue.").to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=100000)
+    args = parser.parse_args()
+
+    assert fresh_static() == template_static()
+    for name, fn in (
+        ("fresh static", fresh_static),
+        ("template static", template_static),
+        ("fresh dynamic", fresh_dynamic),
+        ("template dynamic", template_dynamic),
+    ):
+        best = min(timeit.repeat(fn, number=args.n, repeat=5))
+        print(f"{name:<18} {best / args.n * 1e6:7.2f}us per response")
+
+
+if __name__ == "__main__":
+    main()
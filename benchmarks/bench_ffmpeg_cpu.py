@@ -0,0 +1,79 @@
+# CPU cost of one guild's ffmpeg process: libopus transcode vs Opus passthrough (-c:a copy)
+#
+#   python benchmarks/bench_ffmpeg_cpu.py                      # generates a 60 s Opus/WebM test file
+#   python benchmarks/bench_ffmpeg_cpu.py --input song.webm    # or any local file / stream URL
+#
+# Uses the same argument layout as discord.FFmpegOpusAudio, writing to the null muxer instead of a pipe.
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def opus_args(ffmpeg, source, codec, bitrate):
+    return [
+        ffmpeg, "-hide_banner", "-i", source, "-vn",
+        "-map_metadata", "-1", "-f", "opus", "-c:a", codec,
+        "-ar", "48000", "-ac", "2", "-b:a", f"{bitrate}k", "-loglevel", "warning",
+        "-y", os.devnull,
+    ]
+
+
+def make_test_input(ffmpeg, seconds):
+    path = os.path.join(tempfile.mkdtemp(), "bench.webm")
+    subprocess.run([
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-ac", "2", "-c:a", "libopus", "-b:a", "128k", path,
+    ], check=True)
+    return path
+
+
+def child_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(args, audio_seconds):
+    cpu_before = child_cpu() if resource else 0.0
+    start = time.perf_counter()
+    subprocess.run(args, check=True)
+    wall = time.perf_counter() - start
+    cpu = (child_cpu() - cpu_before) if resource else wall
+    return cpu, wall, cpu / audio_seconds * 100
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input")
+    parser.add_argument("--seconds", type=int, default=60, help="length of the generated test file")
+    parser.add_argument("--bitrate", type=int, default=96)
+    parser.add_argument("--ffmpeg", default=shutil.which("ffmpeg") or "ffmpeg")
+    args = parser.parse_args()
+
+    source = args.input or make_test_input(args.ffmpeg, args.seconds)
+    probe = subprocess.run([args.ffmpeg, "-hide_banner", "-i", source], capture_output=True, text=True)
+    duration = args.seconds
+    for line in probe.stderr.splitlines():
+        if "Duration:" in line:
+            h, m, s = line.split("Duration:")[1].split(",")[0].strip().split(":")
+            duration = int(h) * 3600 + int(m) * 60 + float(s)
+
+    if resource is None:
+        print("resource module unavailable, reporting wall time instead of CPU time", file=sys.stderr)
+
+    print(f"input: {source} ({duration:.1f} s of audio)")
+    for name, codec in (("transcode", "libopus"), ("passthrough", "copy")):
+        cpu, wall, per_guild = run(opus_args(args.ffmpeg, source, codec, args.bitrate), duration)
+        print(f"{name:<12} cpu={cpu:7.3f}s  wall={wall:7.3f}s  ~{per_guild:6.3f}% of one core per guild")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Event loop stalls caused by logging: handlers on the loop thread vs. the queued log pipeline
+#
+#   python benchmarks/bench_logging.py                    # 200 DEBUG records per 20 ms tick
+#   python benchmarks/bench_logging.py --rate 1000 --console
+#
+# A 20 ms ticker stands in for the Opus packet pacing; its lateness is what listeners hear as
+# stutter. Another task logs bursts like discord.py does with voice/gateway DEBUG logs enabled.
+import argparse
+import asyncio
+import logging
+import logging.handlers
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import log_pipeline
+
+TICK = 0.02
+
+
+def make_handlers(directory, console, batching):
+    path = os.path.join(directory, "bench.log")
+    if batching:
+        file_handler = log_pipeline.BatchingRotatingFileHandler(path, encoding="utf-8", maxBytes=5 * 1024 * 1024, backupCount=2)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(path, encoding="utf-8", maxBytes=5 * 1024 * 1024, backupCount=2)
+    stream = sys.stderr if console else open(os.path.join(directory, "console.log"), "w", encoding="utf-8")
+    console_handler = logging.StreamHandler(stream)
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+    return [file_handler, console_handler]
+
+
+async def run(logger, seconds, rate):
+    lateness = []
+    emit_time = 0.0
+    stop = time.perf_counter() + seconds
+
+    async def ticker():
+        next_at = time.perf_counter() + TICK
+        while time.perf_counter() < stop:
+            await asyncio.sleep(max(0, next_at - time.perf_counter()))
+            lateness.append(max(0.0, time.perf_counter() - next_at))
+            next_at += TICK
+
+    async def chatter():
+        nonlocal emit_time
+        n = 0
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            for _ in range(rate):
+                n += 1
+                logger.debug("Sending voice packet %d, sequence %d, timestamp %d", n, n % 65536, n * 960)
+            emit_time += time.perf_counter() - start
+            await asyncio.sleep(TICK)
+        return n
+
+    _, records = await asyncio.gather(ticker(), chatter())
+    return lateness, emit_time, records
+
+
+def report(name, lateness, emit_time, records):
+    lateness = sorted(lateness)
+    p99 = lateness[min(len(lateness) - 1, int(len(lateness) * 0.99))]
+    print(
+        f"{name:<10} tick lateness p50={statistics.median(lateness) * 1000:7.2f}ms p99={p99 * 1000:7.2f}ms "
+        f"max={lateness[-1] * 1000:7.2f}ms  loop time per record={emit_time / records * 1e6:6.2f}us  (records={records})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rate", type=int, default=200, help="DEBUG records per 20 ms tick")
+    parser.add_argument("--console", action="store_true", help="write the console handler to the real stderr")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="musicbot-logbench-")
+    logger = logging.getLogger("bench")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+    handlers = make_handlers(directory, args.console, batching=False)
+    for handler in handlers:
+        logger.addHandler(handler)
+    direct = asyncio.run(run(logger, args.seconds, args.rate))
+    for handler in handlers:
+        logger.removeHandler(handler)
+        handler.close()
+
+    pipeline = log_pipeline.LogPipeline(make_handlers(directory, args.console, batching=True), duplicate_window=0)
+    pipeline.start()
+    logger.addHandler(pipeline.queue_handler)
+    queued = asyncio.run(run(logger, args.seconds, args.rate))
+    logger.removeHandler(pipeline.queue_handler)
+    drain = time.perf_counter()
+    pipeline.stop(timeout=60)
+    drain = time.perf_counter() - drain
+
+    report("direct", *direct)
+    report("pipeline", *queued)
+    print(f"pipeline backlog drained {drain:.2f}s after the run")
+
+
+if __name__ == "__main__":
+    main()
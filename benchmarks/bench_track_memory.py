@@ -0,0 +1,87 @@
+# Memory held by a 10k-track queue spread over many guilds: trimmed yt-dlp info dicts vs Track records
+#
+#   python benchmarks/bench_track_memory.py [--tracks 10000] [--guilds 500]
+import argparse
+import os
+import sys
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from track import Track
+
+
+def fake_info(i):
+    # Shape of a single ytsearch1 entry after play() popped formats/thumbnails/automatic_captions/heatmap
+    video_id = f"vid{i:08d}"
+    stream = f"https://rr1---sn-abc.googlevideo.com/videoplayback?expire=1760000000&id={video_id}&itag=251&mime=audio%2Fwebm&sig={'x' * 120}"
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-us,en;q=0.5",
+        "Sec-Fetch-Mode": "navigate",
+    }
+    return {
+        "id": video_id,
+        "title": f"Artist {i % 97} - Song number {i}",
+        "duration": 180 + i % 240,
+        "thumbnail": f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg",
+        "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+        "url": stream,
+        "description": "Official music video. " * 40,
+        "channel": f"Channel {i % 97}",
+        "channel_id": f"UC{i:022d}",
+        "uploader": f"Channel {i % 97}",
+        "tags": [f"tag{t}" for t in range(15)],
+        "categories": ["Music"],
+        "view_count": i * 1000,
+        "like_count": i * 10,
+        "upload_date": "20240101",
+        "http_headers": headers,
+        "requested_formats": None,
+        "subtitles": {lang: [{"ext": "vtt", "url": f"https://www.youtube.com/api/timedtext?v={video_id}&lang={lang}"}] for lang in ("en", "de", "fr")},
+        "chapters": [{"start_time": c * 60.0, "end_time": c * 60.0 + 60, "title": f"Part {c}"} for c in range(3)],
+        "format_id": "251",
+        "ext": "webm",
+        "acodec": "opus",
+        "vcodec": "none",
+        "abr": 130.5,
+        "asr": 48000,
+        "filesize": 3_500_000 + i,
+        "protocol": "https",
+        "extractor": "youtube",
+        "extractor_key": "Youtube",
+    }
+
+
+def measure(build, tracks, guilds):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    queues = {str(g): deque() for g in range(guilds)}
+    for i in range(tracks):
+        # Each info dict is "extracted" here, only what the queue keeps survives
+        queues[str(i % guilds)].append(build(fake_info(i)))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return retained, queues
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=10000)
+    parser.add_argument("--guilds", type=int, default=500)
+    args = parser.parse_args()
+
+    dict_bytes, _ = measure(lambda info: info, args.tracks, args.guilds)
+    track_bytes, _ = measure(lambda info: Track.from_info(info, requester=1234), args.tracks, args.guilds)
+
+    print(f"{args.tracks} tracks over {args.guilds} guilds")
+    print(f"info dicts   {dict_bytes / 1024 / 1024:8.2f} MiB  ({dict_bytes / args.tracks:8.0f} B/track)")
+    print(f"Track slots  {track_bytes / 1024 / 1024:8.2f} MiB  ({track_bytes / args.tracks:8.0f} B/track)")
+    print(f"reduction    {dict_bytes / max(track_bytes, 1):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
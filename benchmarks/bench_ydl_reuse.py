@@ -0,0 +1,73 @@
+# Per-query latency of a fresh YoutubeDL per extraction vs. the pooled instances in extractor.py
+#
+#   python benchmarks/bench_ydl_reuse.py                 # construction cost only (offline)
+#   python benchmarks/bench_ydl_reuse.py "ytsearch1: lofi" -n 10   # full extraction (network)
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import yt_dlp
+
+import extractor
+
+YDL_OPTIONS = {
+    "format": "bestaudio[abr<=96]/bestaudio/best",
+    "noplaylist": True,
+    "youtube_include_dash_manifest": False,
+    "youtube_include_hls_manifest": False,
+    "quiet": True,
+}
+
+
+def measure(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:<10} mean={statistics.mean(samples):8.2f}ms  p50={statistics.median(samples):8.2f}ms  p99={p99:8.2f}ms  (n={len(samples)})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query", nargs="?", help="run full extractions for this query instead of construction only")
+    parser.add_argument("-n", "--runs", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.query is None:
+        runs = args.runs or 200
+
+        def fresh():
+            with yt_dlp.YoutubeDL(YDL_OPTIONS):
+                pass
+
+        def pooled():
+            extractor._get_ydl(YDL_OPTIONS, 0)
+    else:
+        runs = args.runs or 10
+
+        def fresh():
+            extractor._extract(args.query, YDL_OPTIONS, -1)
+
+        def pooled():
+            extractor._extract(args.query, YDL_OPTIONS, 0)
+
+    # Warm both paths once so imports and the first pooled instance are not measured
+    fresh()
+    pooled()
+    report("fresh", measure(fresh, runs))
+    report("pooled", measure(pooled, runs))
+
+
+if __name__ == "__main__":
+    main()
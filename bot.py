@@ -1,43 +1,315 @@
 # Importing libraries and modules
+import time
+STARTUP = {"import_started": time.perf_counter()}
+
 import os
 import discord
 from discord.ext import commands
 from discord import app_commands
 from dotenv import load_dotenv
-import yt_dlp
-from collections import deque
 import asyncio
 import logging
 import datetime
 import json
+import hashlib
 
 import embeds
+import cache
+import extractor
+import audio_cache
+import state_feed
+import queue_store
+import metrics
+import encoding
+import ffmpeg_supervisor
+from player import GuildPlayer, PlayerState, RESUME_MARGIN
 
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 conf = json.loads(open("config.json", "r").read())
 
-SONG_QUEUES = {}
-CURRENT_SONG = {}
-
-async def search_ytdlp_async(query, ydl_opts):
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, lambda: _extract(query, ydl_opts))
-
-def _extract(query, ydl_opts):
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        try:
-            return ydl.extract_info(query, download=False)
-        except yt_dlp.utils.DownloadError as e:
-            if "Requested format is not available" in str(e):
-                raise ValueError("This video might be DRM-protected or region-locked.")
-            raise
+PLAYERS = {}
+GUILD_FEED = state_feed.GuildStateFeed()
+
+YDL_OPTIONS = {
+    # Prefer Opus so create_source can pass it through without re-encoding
+    "format": "bestaudio[acodec=opus][abr<=96]/bestaudio[abr<=96]/bestaudio/best",
+    "noplaylist": True,
+    "youtube_include_dash_manifest": False,
+    "youtube_include_hls_manifest": False,
+}
+
+PLAYLIST_OPTIONS = {
+    "extract_flat": "in_playlist",
+    "noplaylist": False,
+    "lazy_playlist": True,
+}
+
+FFMPEG_OPTIONS = {
+    "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
+    "options": "-vn",
+}
+
+def owned_sources():
+    # Sources the players still hold, the ffmpeg supervisor kills any other process it finds
+    for guild_player in list(PLAYERS.values()):
+        yield from guild_player.sources()
+
+def guild_is_playing(guild_id) -> bool:
+    guild_player = PLAYERS.get(guild_id)
+    return guild_player is not None and guild_player.voice_client is not None and guild_player.voice_client.is_playing()
+
+FFMPEG = ffmpeg_supervisor.FFmpegSupervisor(
+    ffmpeg_supervisor.find_ffmpeg(conf['ffmpeg']['executable']),
+    max_processes=conf['ffmpeg']['max_processes'],
+    nice=conf['ffmpeg']['nice'],
+    rlimits=conf['ffmpeg']['rlimits'],
+    stall_timeout=conf['ffmpeg']['stall_timeout'],
+    monitor_interval=conf['ffmpeg']['monitor_interval'],
+    end_margin=RESUME_MARGIN,
+    owned=owned_sources,
+    is_playing=guild_is_playing,
+)
+FFMPEG_EXECUTABLE = FFMPEG.executable
+
+SEARCH_CACHE = cache.SearchCache(
+    conf['cache']['file'],
+    memory_entries=conf['cache']['memory_entries'],
+    metadata_ttl=conf['cache']['metadata_ttl'],
+    stream_margin=conf['cache']['stream_url_margin'],
+    default_stream_ttl=conf['cache']['default_stream_ttl'],
+)
+EXTRACTOR = extractor.ExtractionService(
+    workers=conf['extraction']['workers'],
+    use_processes=conf['extraction']['use_processes'],
+    ydl_max_uses=conf['extraction']['ydl_max_uses'],
+)
+AUDIO_CACHE = audio_cache.AudioCache(
+    conf['audio_cache']['directory'],
+    max_bytes=conf['audio_cache']['max_size_mb'] * 1024 * 1024,
+    play_threshold=conf['audio_cache']['play_threshold'],
+    ffmpeg=FFMPEG,
+    bitrate=conf['audio']['bitrate'],
+) if conf['audio_cache']['enabled'] else None
+QUEUE_STORE = queue_store.QueueStore(conf['queue_store']['file']) if conf['queue_store']['enabled'] else None
+
+@metrics.timer("musicbot_search_seconds")
+async def search_ytdlp_async(query, ydl_opts, priority=extractor.PRIORITY_INTERACTIVE):
+    cached_ids = SEARCH_CACHE.get_query(query)
+    if cached_ids:
+        tracks = []
+        for video_id in cached_ids:
+            track = SEARCH_CACHE.get_track(video_id)
+            if track is None:
+                break
+            # Metadata is still good, only the signed stream URL may need re-resolving
+            tracks.append(await ensure_fresh_stream(track, priority, ydl_opts))
+        else:
+            metrics.inc("musicbot_search_total", result="cached")
+            return tracks
+
+    metrics.inc("musicbot_search_total", result="extracted")
+    results = await EXTRACTOR.extract_tracks(query, ydl_opts, priority)
+    SEARCH_CACHE.put(query, results["tracks"])
+    return results["tracks"]
+
+async def ensure_fresh_stream(track, priority=extractor.PRIORITY_INTERACTIVE, ydl_opts=YDL_OPTIONS):
+    if SEARCH_CACHE.stream_is_fresh(track):
+        return track
+    if AUDIO_CACHE is not None and AUDIO_CACHE.contains(track.id):
+        # Played from the local audio cache, no stream URL needed
+        return track
+    cached = SEARCH_CACHE.get_track(track.id)
+    if cached is None or not SEARCH_CACHE.stream_is_fresh(cached):
+        results = await EXTRACTOR.extract_tracks(track.webpage_url, ydl_opts, priority)
+        if not results["tracks"]:
+            raise ValueError(f"Could not resolve a stream for {track.title}.")
+        cached = results["tracks"][0]
+        SEARCH_CACHE.put_track(cached)
+    return cached.replace(requester=track.requester)
+
+def encoding_for(guild_id=None):
+    # Bitrate/format for a guild's next stream, from its channel limit and current host load
+    audio = conf['audio']
+    if not audio['adaptive']['enabled']:
+        return encoding.Encoding(audio['bitrate'], encoding.ytdl_format(audio['bitrate']), 0.0)
+    guild = bot.get_guild(guild_id) if guild_id is not None else None
+    channel = guild.voice_client.channel if guild is not None and guild.voice_client is not None else None
+    selected = encoding.select_encoding(
+        channel_bitrate=getattr(channel, "bitrate", None),
+        active_streams=FFMPEG.running(),
+        cpu_load=encoding.host_cpu_load(),
+        max_bitrate=audio['bitrate'],
+        min_bitrate=audio['adaptive']['min_bitrate'],
+        stream_limit=audio['adaptive']['stream_limit'],
+    )
+    metrics.inc("musicbot_encoding_selected_total", bitrate=selected.bitrate)
+    return selected
+
+def ydl_options_for(selected):
+    if not conf['audio']['adaptive']['enabled']:
+        return dict(YDL_OPTIONS)
+    return {**YDL_OPTIONS, "format": selected.format}
+
+# (guild_id, track id) -> Encoding the track's stream was resolved for, used once more for its source
+TRACK_ENCODINGS = {}
+
+def track_encoding(guild_id, track):
+    # One selection per track, so the format it was extracted with and the bitrate it's encoded at agree
+    key = (guild_id, track.id)
+    selected = TRACK_ENCODINGS.get(key)
+    if selected is None:
+        selected = TRACK_ENCODINGS[key] = encoding_for(guild_id)
+    return selected
+
+async def create_source(track, guild_id=None, offset=0.0):
+    # Resumes and seeks don't go through resolve_track, they pick afresh
+    selected = TRACK_ENCODINGS.pop((guild_id, track.id), None) or encoding_for(guild_id)
+    if AUDIO_CACHE is not None and AUDIO_CACHE.contains(track.id):
+        with metrics.timer("musicbot_source_create_seconds", kind="local"):
+            # Starting mid-track means skipping packets, keep that off the event loop
+            source = await asyncio.to_thread(AUDIO_CACHE.open, track.id, offset) if offset else AUDIO_CACHE.open(track.id)
+        if source is not None:
+            return source
+
+    audio = conf['audio']
+    bitrate = selected.bitrate
+    if audio['passthrough'] and track.acodec is None and audio['probe_unknown_codecs']:
+        # Codec unknown (e.g. generic extractor), let ffmpeg tell us whether it's already Opus
+        kind = "probe"
+
+        def spawn(offset):
+            return ffmpeg_supervisor.probed_opus_audio(
+                track.stream_url, bitrate, executable=FFMPEG_EXECUTABLE, **ffmpeg_options(offset)
+            )
+    else:
+        # codec="opus" makes FFmpegOpusAudio remux with -c:a copy instead of running libopus,
+        # the adaptive format string already capped the source bitrate in that case
+        passthrough = audio['passthrough'] and track.acodec == "opus"
+        kind = "passthrough" if passthrough else "transcode"
+
+        def spawn(offset):
+            return discord.FFmpegOpusAudio(
+                track.stream_url, codec="opus" if passthrough else None, bitrate=bitrate,
+                executable=FFMPEG_EXECUTABLE, **ffmpeg_options(offset)
+            )
+
+    # spawn(offset) is kept by the supervisor to restart a stalled stream where it stopped
+    with metrics.timer("musicbot_source_create_seconds", kind=kind):
+        return await FFMPEG.open(spawn, key=guild_id, duration=track.duration, offset=offset)
+
+async def seek_source(source, offset) -> bool:
+    # Moves a playing source to ``offset`` seconds without touching yt-dlp
+    if isinstance(source, ffmpeg_supervisor.SupervisedSource):
+        await FFMPEG.restart(source, offset)
+        return True
+    if isinstance(source, audio_cache.LocalOpusAudio):
+        await asyncio.to_thread(source.seek, offset)
+        return True
+    return False
+
+def ffmpeg_options(offset=0.0):
+    if not offset:
+        return FFMPEG_OPTIONS
+    # -ss before -i seeks in the input instead of decoding everything up to the offset
+    return {**FFMPEG_OPTIONS, "before_options": f"-ss {offset:.2f} " + FFMPEG_OPTIONS['before_options']}
+
+
+async def resolve_track(track, background=False, guild_id=None):
+    return await ensure_fresh_stream(
+        track, extractor.PRIORITY_BACKGROUND if background else extractor.PRIORITY_INTERACTIVE,
+        ydl_options_for(track_encoding(guild_id, track))
+    )
+
+def _on_track_start(guild_player, track):
+    if AUDIO_CACHE is not None and AUDIO_CACHE.record_play(track.id) and track.stream_url:
+        asyncio.create_task(AUDIO_CACHE.store(track))
+    asyncio.create_task(bot.change_presence(activity=discord.Activity(name=f"Playing: {track.title}", type=discord.ActivityType.listening)))
+
+def get_player(guild_id: int) -> GuildPlayer:
+    guild_player = PLAYERS.get(guild_id)
+    if guild_player is None:
+        guild_player = PLAYERS[guild_id] = GuildPlayer(
+            guild_id,
+            resolve=lambda track, background=False: resolve_track(track, background, guild_id),
+            create_source=lambda track, offset=0.0: create_source(track, guild_id, offset),
+            lookahead=conf['prefetch']['lookahead_seconds'] if conf['prefetch']['enabled'] else None,
+            on_track_start=_on_track_start,
+            on_change=lambda guild_player: publish_guild(guild_player.guild_id),
+            journal=QUEUE_STORE.record if QUEUE_STORE is not None else None,
+            idle_linger=conf['voice']['idle_linger'],
+            seek_source=seek_source,
+        )
+        restore_queue(guild_player)
+    return guild_player
+
+def restore_queue(guild_player):
+    # Lazy: a guild's saved queue is only rebuilt the first time its player is needed
+    if QUEUE_STORE is None:
+        return
+    state = QUEUE_STORE.load(guild_player.guild_id)
+    if state is None:
+        return
+    entries = ([state["current"]] if state["current"] else []) + state["queue"]
+    tracks = [queue_store.entry_track(entry, SEARCH_CACHE.get_track(entry[0])) for entry in entries]
+    guild_player.restore(tracks, state["position"])
+    logger.info(f"Restored {len(tracks)} queued tracks for guild {guild_player.guild_id}.")
+
+def save_positions():
+    for guild_player in list(PLAYERS.values()):
+        if guild_player.current is not None:
+            QUEUE_STORE.record(guild_player.guild_id, "position", round(guild_player.position(), 1))
+
+async def compact_queue_store():
+    while True:
+        await asyncio.sleep(conf['queue_store']['compact_interval'])
+        save_positions()
+        await asyncio.to_thread(QUEUE_STORE.compact)
+
+
+VOICE_CONNECT_LATENCY = {}  # guild_id -> seconds the last connect/move took
+
+async def reap_idle_voice():
+    # Disconnects sessions that lingered idle for longer than voice.idle_linger, all at once
+    linger = conf['voice']['idle_linger']
+    while True:
+        await asyncio.sleep(conf['voice']['reaper_interval'])
+        now = time.monotonic()
+        expired = [
+            guild_player for guild_player in list(PLAYERS.values())
+            if guild_player.idle_since is not None and now - guild_player.idle_since >= linger
+            and guild_player.state is PlayerState.IDLE and not guild_player.queue
+        ]
+        voice_clients = []
+        for guild_player in expired:
+            guild_player.idle_since = None
+            if guild_player.voice_client is not None and guild_player.voice_client.is_connected():
+                voice_clients.append(guild_player.voice_client)
+        if voice_clients:
+            await asyncio.gather(*(voice_client.disconnect() for voice_client in voice_clients), return_exceptions=True)
+            logger.info(f"Disconnected {len(voice_clients)} idle voice sessions.")
+
+# Gauges are sampled when /metrics is scraped, nothing is computed on the hot path
+metrics.gauge("musicbot_queue_length", lambda: {guild_id: len(p.queue) for guild_id, p in list(PLAYERS.items())}, label="guild", help="Queued tracks per guild")
+metrics.gauge("musicbot_voice_clients", lambda: len(bot.voice_clients), help="Connected voice clients")
+metrics.gauge("musicbot_voice_connect_last_seconds", lambda: dict(VOICE_CONNECT_LATENCY), label="guild", help="Latest voice connect/move latency per guild")
+metrics.gauge("musicbot_ffmpeg_processes", lambda: FFMPEG.running(), help="Running ffmpeg processes")
+metrics.gauge("musicbot_ffmpeg_cpu_seconds", lambda: {guild_id: usage[0] for guild_id, usage in FFMPEG.usage.items()}, label="guild", help="CPU time of the running ffmpeg processes per guild")
+metrics.gauge("musicbot_ffmpeg_rss_bytes", lambda: {guild_id: usage[1] for guild_id, usage in FFMPEG.usage.items()}, label="guild", help="Resident memory of the running ffmpeg processes per guild")
+metrics.gauge("musicbot_ffmpeg_events", lambda: dict(FFMPEG.counters), label="event", help="ffmpeg supervisor counters")
+metrics.gauge("musicbot_extraction_pending", lambda: EXTRACTOR.pending(), help="Queued yt-dlp extractions")
+metrics.gauge("musicbot_search_cache_events", lambda: dict(SEARCH_CACHE.counters), label="event", help="Search cache counters")
+if AUDIO_CACHE is not None:
+    metrics.gauge("musicbot_audio_cache_events", lambda: dict(AUDIO_CACHE.counters), label="event", help="Audio cache counters")
 
 
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+if conf['sharding']['mode'] in ("auto", "processes"):
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents, shard_count=conf['sharding']['shard_count'] or None)
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents)
 logger = logging.getLogger("discord")
 
 is_ready = False
@@ -46,26 +318,85 @@ is_ready = False
 async def on_ready():
     global is_ready
 
-    await bot.tree.sync()
     logger.info(f"Logged in as {bot.user} (ID: {bot.user.id})")
     logger.info("Bot is ready!")
+    for guild in bot.guilds:
+        publish_guild(guild.id)
+    if not is_ready:
+        log_startup_report()
+        # on_ready fires again on every gateway reconnect, the command tree only needs checking once
+        if not getattr(bot, "shard_ids", None) or 0 in bot.shard_ids:
+            BACKGROUND_TASKS.append(asyncio.create_task(sync_commands()))
+        # Pay for the yt-dlp import and extractor setup now rather than on the first /play
+        BACKGROUND_TASKS.append(asyncio.create_task(EXTRACTOR.warm_up(dict(YDL_OPTIONS))))
     is_ready = True
 
+async def sync_commands():
+    # Syncing is a rate-limited API call, only do it when the command definitions changed
+    start = time.perf_counter()
+    settings = conf['commands']
+    guild = discord.Object(id=settings['dev_guild_id']) if settings['dev_guild_id'] else None
+    if guild is not None:
+        # Guild commands update instantly, handy while developing
+        bot.tree.copy_global_to(guild=guild)
+
+    definitions = sorted((command.to_dict(bot.tree) for command in bot.tree.get_commands(guild=guild)), key=lambda d: d["name"])
+    digest = hashlib.sha256(json.dumps(definitions, sort_keys=True).encode()).hexdigest()
+    target = f"{bot.application_id}:{guild.id if guild else 'global'}"
+
+    try:
+        with open(settings['sync_state_file'], "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    if state.get(target) == digest:
+        logger.info(f"Command tree unchanged, sync skipped ({(time.perf_counter() - start) * 1000:.1f}ms).")
+        return
+
+    try:
+        synced = await bot.tree.sync(guild=guild)
+    except discord.HTTPException as e:
+        logger.error(f"Failed to sync the command tree: {e}")
+        return
+    state[target] = digest
+    with open(settings['sync_state_file'], "w") as f:
+        json.dump(state, f, indent=4)
+    logger.info(f"Synced {len(synced)} commands to {'guild ' + str(guild.id) if guild else 'all guilds'} in {time.perf_counter() - start:.2f}s.")
+
+def log_startup_report():
+    ready = time.perf_counter()
+    started = STARTUP.get("process_started", STARTUP["import_started"])
+    logger.info(
+        f"Startup: imports {STARTUP['imported'] - started:.2f}s (bot module {STARTUP['imported'] - STARTUP['import_started']:.2f}s), "
+        f"login to ready {ready - STARTUP['login']:.2f}s, total {ready - started:.2f}s"
+    )
+
+@bot.event
+async def on_guild_join(guild):
+    publish_guild(guild.id)
+
+@bot.event
+async def on_guild_update(before, after):
+    publish_guild(after.id)
+
+@bot.event
+async def on_guild_remove(guild):
+    GUILD_FEED.remove(guild.id)
+
+@bot.event
+async def on_voice_state_update(member, before, after):
+    if member.id != bot.user.id:
+        return
+    publish_guild(member.guild.id)
+    # The voice client is torn down/finished connecting shortly after the gateway event
+    bot.loop.call_later(1, publish_guild, member.guild.id)
+
 @bot.tree.command(name="skip", description="Skips the current playing song")
 async def skip(interaction: discord.Interaction):
-    if interaction.guild.voice_client and (interaction.guild.voice_client.is_playing() or interaction.guild.voice_client.is_paused()):
-        interaction.guild.voice_client.stop()
-        await interaction.response.send_message(embed=embeds.generic_embed(
-            title=":white_check_mark: Skipped",
-            description="Skipped the current song.",
-            color=discord.Color.green()
-        ), ephemeral=True) 
+    if get_player(interaction.guild_id).skip():
+        await embeds.respond(interaction, embeds.from_template("skipped"))
     else:
-        await interaction.response.send_message(embed=embeds.generic_embed(
-            title=":x: Error",
-            description="No song is currently playing.",
-            color=discord.Color.red()
-        ), ephemeral=True)
+        await embeds.respond(interaction, embeds.from_template("not_playing"))
 
 
 @bot.tree.command(name="pause", description="Pause the currently playing song.")
@@ -74,25 +405,12 @@ async def pause(interaction: discord.Interaction):
     voice_client = interaction.guild.voice_client
 
     if voice_client is None:
-        return await interaction.response.send_message(embed=embeds.generic_embed(
-            title=":x: Error",
-            description="I'm not connected to any voice channel.",
-            color=discord.Color.red()
-        ), ephemeral=True)
+        return await embeds.respond(interaction, embeds.from_template("not_connected"))
 
-    if not voice_client.is_playing():
-        return await interaction.response.send_message(embed=embeds.generic_embed(
-            title=":x: Error",
-            description="I'm not currently playing any song.",
-            color=discord.Color.red()
-        ), ephemeral=True)
+    if not get_player(interaction.guild_id).pause():
+        return await embeds.respond(interaction, embeds.from_template("not_playing"))
     
-    voice_client.pause()
-    await interaction.response.send_message(embed=embeds.generic_embed(
-        title=":pause_button: Paused",
-        description="Playback has been paused.",
-        color=discord.Color.yellow()
-    ), ephemeral=True)
+    await embeds.respond(interaction, embeds.from_template("paused"))
 
 
 @bot.tree.command(name="resume", description="Resume the currently paused song.")
@@ -100,25 +418,12 @@ async def resume(interaction: discord.Interaction):
     voice_client = interaction.guild.voice_client
 
     if voice_client is None:
-        return await interaction.response.send_message(embed=embeds.generic_embed(
-            title=":x: Error",
-            description="I'm not connected to any voice channel.",
-            color=discord.Color.red()
-        ), ephemeral=True)
+        return await embeds.respond(interaction, embeds.from_template("not_connected"))
 
-    if not voice_client.is_paused():
-        return await interaction.response.send_message(embed=embeds.generic_embed(
-            title=":x: Error",
-            description="I’m not paused right now.",
-            color=discord.Color.red()
-        ), ephemeral=True)
+    if not get_player(interaction.guild_id).resume():
+        return await embeds.respond(interaction, embeds.from_template("not_paused"))
     
-    voice_client.resume()
-    await interaction.response.send_message(embed=embeds.generic_embed(
-        title=":arrow_forward: Resumed",
-        description="Playback has been resumed.",
-        color=discord.Color.green()
-    ), ephemeral=True)
+    await embeds.respond(interaction, embeds.from_template("resumed"))
 
 
 @bot.tree.command(name="stop", description="Stop playback and clear the queue.")
@@ -126,148 +431,330 @@ async def stop(interaction: discord.Interaction):
     voice_client = interaction.guild.voice_client
 
     if not voice_client or not voice_client.is_connected():
-        return await interaction.response.send_message(embed=embeds.generic_embed(
-            title=":x: Error",
-            description="I'm not connected to any voice channel.",
-            color=discord.Color.red()
-        ), ephemeral=True)
-
-    guild_id_str = str(interaction.guild_id)
-    if guild_id_str in SONG_QUEUES:
-        SONG_QUEUES[guild_id_str].clear()
-
-    if voice_client.is_playing() or voice_client.is_paused():
-        voice_client.stop()
+        return await embeds.respond(interaction, embeds.from_template("not_connected"))
 
+    await get_player(interaction.guild_id).stop()
     await voice_client.disconnect()
 
-    await interaction.response.send_message(embed=embeds.generic_embed(
-        title=":stop_button: Stopped",
-        description="Playback has been stopped and the queue cleared.",
-        color=discord.Color.red()
-    ), ephemeral=True)
+    await embeds.respond(interaction, embeds.from_template("stopped"))
 
 
-@bot.tree.command(name="play", description="Play a song or add it to the queue.")
-@app_commands.describe(song_query="Search query")
-async def play(interaction: discord.Interaction, song_query: str):
-    if not interaction.response.is_done():
-        await interaction.response.defer(ephemeral=True)
+async def connect_to_user(interaction: discord.Interaction):
+    if not interaction.user.voice or interaction.user.voice.channel is None:
+        await embeds.respond(interaction, embeds.from_template("not_in_voice"))
+        return None
 
-    if not interaction.user.voice:
-        await interaction.followup.send(embed=embeds.generic_embed(
-            title=":x: Error",
-            description="You must be in a voice channel to use this command.",
-            color=discord.Color.red()
-        ), ephemeral=True)
-        return
-    
     voice_channel = interaction.user.voice.channel
-
-    if voice_channel is None:
-        await interaction.followup.send(embed=embeds.generic_embed(
-            title=":x: Error",
-            description="You must be in a voice channel to use this command.",
-            color=discord.Color.red()
-        ), ephemeral=True)
-        return
-
     voice_client = interaction.guild.voice_client
 
+    if voice_client is not None and not voice_client.is_connected():
+        # Half-dead session (e.g. dropped while lingering), start over
+        await voice_client.disconnect(force=True)
+        voice_client = None
+
+    start = time.perf_counter()
     if voice_client is None:
         voice_client = await voice_channel.connect()
+        outcome = "connected"
     elif voice_channel != voice_client.channel:
+        # Same session, only the channel changes
         await voice_client.move_to(voice_channel)
+        outcome = "moved"
+    else:
+        outcome = "reused"
+    elapsed = time.perf_counter() - start
+    metrics.inc("musicbot_voice_sessions_total", outcome=outcome)
+    if outcome != "reused":
+        metrics.observe("musicbot_voice_connect_seconds", elapsed, kind=outcome)
+        VOICE_CONNECT_LATENCY[interaction.guild_id] = round(elapsed, 3)
+    return voice_client
 
-    ydl_options = {
-        "format": "bestaudio[abr<=96]/bestaudio/best",
-        "noplaylist": True,
-        "youtube_include_dash_manifest": False,
-        "youtube_include_hls_manifest": False,
-    }
 
-    query = "ytsearch1: " + song_query
-    results = await search_ytdlp_async(query, ydl_options)
-    tracks = results.get("entries", [])
+@bot.tree.command(name="play", description="Play a song or add it to the queue.")
+@app_commands.describe(song_query="Search query")
+async def play(interaction: discord.Interaction, song_query: str):
+    if not interaction.response.is_done():
+        await interaction.response.defer(ephemeral=True)
 
-    if tracks is None:
-        await interaction.followup.send(embed=embeds.generic_embed(
-            title=":x: Error",
-            description="No results found for your query.",
-            color=discord.Color.red()
-        ), ephemeral=True)
+    voice_client = await connect_to_user(interaction)
+    if voice_client is None:
         return
 
-    first_track = tracks[0]
-    # Remove unnecessary fields
-    for key in ['formats', 'thumbnails', 'automatic_captions', 'heatmap']:
-        first_track.pop(key, None)
+    selected = encoding_for(interaction.guild_id)
+    if song_query.startswith("id:"):
+        # Picked from autocomplete, no search needed
+        tracks = await tracks_by_id(song_query[3:], selected)
+    else:
+        tracks = await search_ytdlp_async("ytsearch1: " + song_query, ydl_options_for(selected))
 
-    guild_id = str(interaction.guild_id)
-    if SONG_QUEUES.get(guild_id) is None:
-        SONG_QUEUES[guild_id] = deque()
+    if not tracks:
+        await embeds.respond(interaction, embeds.from_template("no_results"))
+        return
 
-    SONG_QUEUES[guild_id].append(first_track)
+    first_track = tracks[0].replace(requester=interaction.user.id)
+    TRACK_ENCODINGS[(interaction.guild_id, first_track.id)] = selected
+    guild_player = get_player(interaction.guild_id)
+    already_queued = guild_player.queue.contains(first_track.id)
+    started = await guild_player.enqueue(voice_client, [first_track])
 
-    title = first_track.get("title", "Untitled")
-    if voice_client.is_playing() or voice_client.is_paused():
+    title = first_track.title
+    if not started:
         await interaction.followup.send(embed=embeds.song_embed(
             title=f":musical_note: {title}",
-            description="**Added to queue.**",
+            description="**Added to queue.**" + ("\nIt was already queued, it will play twice." if already_queued else ""),
             color=discord.Color.blue(),
-            thumbnail_url=first_track.get("thumbnail")
+            thumbnail_url=first_track.thumbnail
         ), ephemeral=True)
     else:
         await interaction.followup.send(embed=embeds.song_embed(
             title=f":musical_note: {title}",
-            description=f"**Now playing.**\nDuration: {datetime.timedelta(seconds=first_track.get('duration', 0))}",
+            description=f"**Now playing.**\nDuration: {datetime.timedelta(seconds=first_track.duration or 0)}",
             color=discord.Color.green(),
-            thumbnail_url=first_track.get("thumbnail")
+            thumbnail_url=first_track.thumbnail
         ), ephemeral=True)
-        await play_next_song(voice_client, guild_id, interaction.channel)
 
 
-async def play_next_song(voice_client, guild_id, channel):
-    if SONG_QUEUES[guild_id]:
-        track = SONG_QUEUES[guild_id].popleft()
-        with open("test.json", "w", encoding="utf-8") as f: # DEBUG
-            json.dump(track, f, indent=4, ensure_ascii=False)
+@play.autocomplete("song_query")
+async def play_autocomplete(interaction: discord.Interaction, current: str):
+    # Answered from the local title index only, Discord gives us 3 seconds
+    with metrics.timer("musicbot_autocomplete_seconds"):
+        suggestions = SEARCH_CACHE.suggest(current)
+    return [
+        app_commands.Choice(
+            name=(f"{title} [{datetime.timedelta(seconds=int(duration))}]" if duration else title)[:100],
+            value=f"id:{video_id}"
+        )
+        for video_id, title, duration in suggestions
+    ]
+
+
+async def tracks_by_id(video_id, selected):
+    ydl_opts = ydl_options_for(selected)
+    track = SEARCH_CACHE.get_track(video_id)
+    if track is not None:
+        return [await ensure_fresh_stream(track, ydl_opts=ydl_opts)]
+    return await search_ytdlp_async(queue_store.YOUTUBE_WATCH_URL.format(video_id), ydl_opts)
 
-        audio_url = track["url"]
-        title = track.get("title", "Untitled")
 
-        ffmpeg_options = {
-            "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
-            "options": "-vn -c:a libopus -b:a 96k",
-        }
+@bot.tree.command(name="playlist", description="Queue every track of a playlist.")
+@app_commands.describe(playlist_url="Playlist URL")
+async def playlist(interaction: discord.Interaction, playlist_url: str):
+    if not interaction.response.is_done():
+        await interaction.response.defer(ephemeral=True)
+
+    voice_client = await connect_to_user(interaction)
+    if voice_client is None:
+        return
 
-        source = discord.FFmpegOpusAudio(audio_url, **ffmpeg_options, executable="bin\\ffmpeg\\ffmpeg.exe")
+    # Only the first entry is fetched up front, the rest is streamed in by _enqueue_playlist_rest
+    try:
+        results = await EXTRACTOR.extract_tracks(playlist_url, {**PLAYLIST_OPTIONS, "playlist_items": "1"})
+    except Exception as e:
+        logger.error(f"Failed to load playlist {playlist_url}: {e}")
+        results = {"tracks": []}
 
-        def after_play(error):
-            if error:
-                print(f"Error playing {title}: {error}")
-            asyncio.run_coroutine_threadsafe(play_next_song(voice_client, guild_id, channel), bot.loop)
+    if not results["tracks"]:
+        await embeds.respond(interaction, embeds.from_template("empty_playlist"))
+        return
 
-        voice_client.play(source, after=after_play)
-        asyncio.create_task(bot.change_presence(activity=discord.Activity(name=f"Playing: {title}", type=discord.ActivityType.listening)))
-        CURRENT_SONG[guild_id] = (audio_url, title, track)
+    # Flat entries come back as stubs, the stream URL is resolved by ensure_fresh_stream when it's needed
+    first_track = results["tracks"][0].replace(requester=interaction.user.id)
+    guild_player = get_player(interaction.guild_id)
+    await guild_player.enqueue(voice_client, [first_track])
+    if results["playlist"]:
+        guild_player.start_loader(_enqueue_playlist_rest(guild_player, voice_client, playlist_url, interaction.user.id))
+        description = f"**Queued.** Starting with {first_track.title}, loading the remaining tracks in the background."
     else:
-        await voice_client.disconnect()
-        SONG_QUEUES[guild_id] = deque()
+        # A single video, playlist_items is ignored and every page would return it again
+        description = f"**Queued.** {first_track.title} is a single song, not a playlist."
+
+    await interaction.followup.send(embed=embeds.song_embed(
+        title=f":notepad_spiral: {results['title'] or 'Playlist'}",
+        description=description,
+        color=discord.Color.green(),
+        url=results["webpage_url"]
+    ), ephemeral=True)
+
+
+async def _enqueue_playlist_rest(guild_player, voice_client, playlist_url, requester):
+    page_size = conf['playlist']['page_size']
+    max_tracks = conf['playlist']['max_tracks']
+    start = 2
+    loaded = 1
+    try:
+        while start <= max_tracks and voice_client.is_connected():
+            end = min(start + page_size - 1, max_tracks)
+            results = await EXTRACTOR.extract_tracks(
+                playlist_url, {**PLAYLIST_OPTIONS, "playlist_items": f"{start}-{end}"}, extractor.PRIORITY_BACKGROUND
+            )
+            if not voice_client.is_connected():
+                break
+            tracks = results["tracks"]
+            for track in tracks:
+                track.requester = requester
+            await guild_player.extend(tracks)
+            loaded += len(tracks)
+            if len(tracks) < end - start + 1:
+                break
+            start = end + 1
+        logger.info(f"Finished loading playlist for guild {guild_player.guild_id} ({loaded} tracks).")
+    except Exception as e:
+        logger.error(f"Failed to load the rest of playlist {playlist_url}: {e}")
 
 
 @bot.tree.command(name="queue", description="Show the current song queue.")
 async def queue(interaction: discord.Interaction):
-    guild_id = str(interaction.guild_id)
-    queue = SONG_QUEUES.get(guild_id, deque())
-    if not queue:
+    guild_player = get_player(interaction.guild_id)
+    if not guild_player.queue and guild_player.current is None:
         await interaction.response.send_message("The queue is empty.")
         return
 
-    queue_list = [f"{idx+1}. {track.get('title', 'Untitled')}" for idx, track in enumerate(queue)]
-    message = "**Current Queue:**\n" + "\n".join(queue_list)
-    await interaction.response.send_message(message)
+    view = QueueView(guild_player)
+    await interaction.response.send_message(embed=view.render(), view=view)
+
+
+QUEUE_PAGE_SIZE = 10
+QUEUE_PAGES = {}  # guild_id -> (queue version, {page: description})
+
+def format_duration(seconds):
+    return str(datetime.timedelta(seconds=int(seconds or 0)))
+
+def queue_page_text(guild_player, page):
+    # Page bodies are the expensive part, cached until the queue changes
+    version, pages = QUEUE_PAGES.get(guild_player.guild_id, (None, None))
+    if version != guild_player.queue.version:
+        pages = {}
+        QUEUE_PAGES[guild_player.guild_id] = (guild_player.queue.version, pages)
+    text = pages.get(page)
+    if text is None:
+        start = page * QUEUE_PAGE_SIZE
+        lines = [
+            f"`{start + i + 1}.` {track.title[:80]} `[{format_duration(track.duration) if track.duration else '?'}]`"
+            for i, track in enumerate(guild_player.queue.slice(start, start + QUEUE_PAGE_SIZE))
+        ]
+        text = pages[page] = "\n".join(lines) or "Nothing queued after this song."
+    return text
+
+class QueueView(discord.ui.View):
+    def __init__(self, guild_player):
+        super().__init__(timeout=120)
+        self.guild_player = guild_player
+        self.page = 0
+
+    def page_count(self):
+        return max(1, -(-len(self.guild_player.queue) // QUEUE_PAGE_SIZE))
+
+    def render(self):
+        guild_player = self.guild_player
+        self.page = min(self.page, self.page_count() - 1)
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.page_count() - 1
+
+        description = queue_page_text(guild_player, self.page)
+        remaining = guild_player.queue.duration
+        if guild_player.current is not None:
+            current = guild_player.current
+            description = f"**Now playing:** {current.title[:80]}\n\n" + description
+            if current.duration:
+                remaining += max(0, current.duration - guild_player.position())
+        unknown = "+" if guild_player.queue.unknown_durations else ""
+        return embeds.generic_embed(
+            title=":notepad_spiral: Current Queue",
+            description=description,
+            color=discord.Color.blurple(),
+            footer=f"Page {self.page + 1}/{self.page_count()} · {len(guild_player.queue)} tracks · {format_duration(remaining)}{unknown} remaining"
+        )
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(0, self.page - 1)
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(embed=self.render(), view=self)
     
+def queue_position_error(guild_player):
+    # Reply for a position the player found outside the queue (it checks under its lock)
+    return embeds.from_template(
+        "error",
+        description=f"Pick a position between 1 and {len(guild_player.queue)}." if guild_player.queue else "The queue is empty."
+    )
+
+
+@bot.tree.command(name="remove", description="Remove a song from the queue.")
+@app_commands.describe(position="Position in the queue")
+async def remove(interaction: discord.Interaction, position: int):
+    guild_player = get_player(interaction.guild_id)
+    track = await guild_player.remove(position - 1)
+    if track is None:
+        return await embeds.respond(interaction, queue_position_error(guild_player))
+    await embeds.respond(interaction, embeds.from_template("removed", description=f"Removed **{track.title}** from the queue."))
+
+
+@bot.tree.command(name="move", description="Move a song to another position in the queue.")
+@app_commands.describe(source="Current position", destination="New position")
+async def move(interaction: discord.Interaction, source: int, destination: int):
+    guild_player = get_player(interaction.guild_id)
+    track = await guild_player.move(source - 1, destination - 1)
+    if track is None:
+        return await embeds.respond(interaction, queue_position_error(guild_player))
+    await embeds.respond(interaction, embeds.from_template("moved", description=f"Moved **{track.title}** to position {destination}."))
+
+
+@bot.tree.command(name="jump", description="Skip ahead to a song in the queue.")
+@app_commands.describe(position="Position in the queue")
+async def jump(interaction: discord.Interaction, position: int):
+    guild_player = get_player(interaction.guild_id)
+    track = await guild_player.jump(position - 1)
+    if track is None:
+        return await embeds.respond(interaction, queue_position_error(guild_player))
+    await embeds.respond(interaction, embeds.from_template("jumped", description=f"Skipped ahead to **{track.title}**."))
+
+
+@bot.tree.command(name="shuffle", description="Shuffle the queue.")
+async def shuffle(interaction: discord.Interaction):
+    guild_player = get_player(interaction.guild_id)
+    if len(guild_player.queue) < 2:
+        return await embeds.respond(interaction, embeds.from_template("nothing_to_shuffle"))
+
+    await guild_player.shuffle()
+    await embeds.respond(interaction, embeds.from_template("shuffled", description=f"Shuffled {len(guild_player.queue)} songs."))
+
+
+def parse_timestamp(text):
+    # "90", "1:30" or "1:01:30" -> seconds, None when it isn't a timestamp
+    seconds = 0
+    for part in text.strip().split(":"):
+        if not part.isdigit():
+            return None
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+@bot.tree.command(name="seek", description="Jump to a position in the current song.")
+@app_commands.describe(timestamp="Position like 90, 1:30 or 1:01:30")
+async def seek(interaction: discord.Interaction, timestamp: str):
+    guild_player = get_player(interaction.guild_id)
+    track = guild_player.current
+    if track is None or guild_player.state not in (PlayerState.PLAYING, PlayerState.PAUSED):
+        return await embeds.respond(interaction, embeds.from_template("not_playing"))
+
+    seconds = parse_timestamp(timestamp)
+    if seconds is None:
+        return await embeds.respond(interaction, embeds.from_template("error", description="Use a timestamp like 90, 1:30 or 1:01:30."))
+    if track.duration and seconds >= track.duration:
+        return await embeds.respond(interaction, embeds.from_template(
+            "error", description=f"**{track.title}** is only {format_duration(track.duration)} long."
+        ))
+
+    await interaction.response.defer(ephemeral=True)
+    if not await guild_player.seek(seconds):
+        return await embeds.respond(interaction, embeds.from_template("error", description="This song can't be seeked."))
+    await embeds.respond(interaction, embeds.from_template(
+        "seeked", description=f"Jumped to {format_duration(seconds)} in **{track.title}**."
+    ))
+
 # WIP
 # @bot.tree.command(name="details", description="Shows raw details of the current song.")
 # async def details(interaction: discord.Interaction):
@@ -300,31 +787,119 @@ async def queue(interaction: discord.Interaction):
 
 # GUI Utils
 async def skip_song(guild_id: int):
-    voice_client = discord.utils.find(lambda vc: vc.guild.id == guild_id, bot.voice_clients)
-    if voice_client and (voice_client.is_playing() or voice_client.is_paused()):
-        voice_client.stop()
+    guild_player = PLAYERS.get(guild_id)
+    if guild_player:
+        guild_player.skip()
         
 async def pause_song(guild_id: int):
-    voice_client = discord.utils.find(lambda vc: vc.guild.id == guild_id, bot.voice_clients)
-    if voice_client and voice_client.is_playing():
-        voice_client.pause()
+    guild_player = PLAYERS.get(guild_id)
+    if guild_player:
+        guild_player.pause()
         
 async def resume_song(guild_id: int):
-    voice_client = discord.utils.find(lambda vc: vc.guild.id == guild_id, bot.voice_clients)
-    if voice_client and voice_client.is_paused():
-        voice_client.resume()
+    guild_player = PLAYERS.get(guild_id)
+    if guild_player:
+        guild_player.resume()
         
 async def song_status(guild_id: int):
-    voice_client = discord.utils.find(lambda vc: vc.guild.id == guild_id, bot.voice_clients)
-    if voice_client:
-        if voice_client.is_playing():
+    guild_player = PLAYERS.get(guild_id)
+    if guild_player:
+        if guild_player.state is PlayerState.PLAYING:
             return "Playing"
-        elif voice_client.is_paused():
+        elif guild_player.state is PlayerState.PAUSED:
             return "Paused"
     return "Stopped"
 
+async def disconnect_guild(guild_id: int):
+    guild_player = PLAYERS.get(guild_id)
+    if guild_player:
+        await guild_player.stop()
+    voice_client = discord.utils.find(lambda vc: vc.guild.id == guild_id, bot.voice_clients)
+    if voice_client and voice_client.is_connected():
+        await voice_client.disconnect()
+
+GUILD_COMMANDS = {
+    "skip": skip_song,
+    "pause": pause_song,
+    "resume": resume_song,
+    "disconnect": disconnect_guild,
+}
+
+async def guild_command(guild_id: int, command: str):
+    await GUILD_COMMANDS[command](guild_id)
+
+def guild_row(guild):
+    # Plain, picklable row describing a guild, published through GUILD_FEED to the GUI and shard supervisors
+    voice_client = guild.voice_client
+    guild_player = PLAYERS.get(guild.id)
+    if voice_client and voice_client.is_connected() and voice_client.channel:
+        state = guild_player.state if guild_player else PlayerState.IDLE
+        status = {PlayerState.PLAYING: "Playing", PlayerState.PAUSED: "Paused"}.get(state, "Active")
+        channel = voice_client.channel.name
+        track = guild_player.current if guild_player else None
+    else:
+        status, channel, track = "Inactive", None, None
+    return {
+        "guild_id": guild.id,
+        "name": guild.name,
+        "status": status,
+        "channel": channel,
+        "title": track.title if track else None,
+        "duration": track.duration if track else None,
+    }
+
+def publish_guild(guild_id: int):
+    guild = bot.get_guild(guild_id)
+    if guild is None:
+        GUILD_FEED.remove(guild_id)
+    else:
+        GUILD_FEED.update(guild_row(guild))
+
 # Run the bot
+BACKGROUND_TASKS = []
+
+def configure_shards(shard_ids, shard_count):
+    # Used by shard worker processes before run_bot, see shards.py
+    bot.shard_ids = shard_ids
+    bot.shard_count = shard_count
+
+async def shutdown():
+    for task in BACKGROUND_TASKS:
+        task.cancel()
+    BACKGROUND_TASKS.clear()
+    if QUEUE_STORE is not None:
+        # Closed before the voice clients go away, so the disconnects don't drain the saved queues
+        save_positions()
+        QUEUE_STORE.compact()
+        QUEUE_STORE.close()
+    await bot.close()
+    EXTRACTOR.close()
+    FFMPEG.close()
+
+def start_metrics():
+    settings = conf['metrics']
+    if not settings['enabled']:
+        return
+    # One endpoint per shard worker process, offset by its first shard ID
+    port = settings['port'] + (bot.shard_ids[0] if getattr(bot, "shard_ids", None) else 0)
+    try:
+        metrics.start_http_server(settings['host'], port)
+    except OSError as e:
+        logger.warning(f"Could not start metrics endpoint on port {port}: {e}")
+    BACKGROUND_TASKS.append(asyncio.create_task(metrics.monitor_loop_lag(settings['loop_lag_interval'])))
+
 async def run_bot(loop):
     asyncio.set_event_loop(loop)
+    start_metrics()
+    if QUEUE_STORE is not None:
+        await asyncio.to_thread(QUEUE_STORE.compact)
+        BACKGROUND_TASKS.append(asyncio.create_task(compact_queue_store()))
+    if conf['voice']['idle_linger']:
+        BACKGROUND_TASKS.append(asyncio.create_task(reap_idle_voice()))
+    BACKGROUND_TASKS.append(asyncio.create_task(FFMPEG.monitor()))
+    logger.info(f"Using ffmpeg at {FFMPEG_EXECUTABLE}.")
+    STARTUP["login"] = time.perf_counter()
     await bot.start(TOKEN)
-    
\ No newline at end of file
+    
+
+STARTUP["imported"] = time.perf_counter()
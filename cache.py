@@ -0,0 +1,196 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from track import Track
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def fts_prefix_query(text: str) -> str:
+    # Every word must match as a prefix: 'lofi hip' -> '"lofi"* "hip"*'
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+
+class SearchCache:
+    """Two-tier (memory LRU + SQLite) cache of search results and Track metadata."""
+
+    def __init__(self, path, memory_entries=1024, metadata_ttl=604800, stream_margin=300, default_stream_ttl=18000):
+        self.memory_entries = memory_entries
+        self.metadata_ttl = metadata_ttl
+        self.stream_margin = stream_margin
+        self.default_stream_ttl = default_stream_ttl
+
+        self._lock = threading.Lock()
+        self._tracks = OrderedDict()   # video_id -> (Track, stored_at)
+        self._queries = OrderedDict()  # normalized query -> (ids, stored_at)
+        self.counters = {"hits": 0, "stale": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS tracks (id TEXT PRIMARY KEY, info TEXT NOT NULL, stored_at REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS queries (query TEXT PRIMARY KEY, ids TEXT NOT NULL, stored_at REAL NOT NULL)")
+        self._fts = self._create_title_index()
+        self._db.commit()
+        self.prune()
+
+    def _create_title_index(self) -> bool:
+        # Full-text prefix index over titles for /play autocomplete, LIKE scans when FTS5 isn't compiled in
+        exists = self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'track_titles'").fetchone()
+        if exists:
+            return True
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE track_titles USING fts5(id UNINDEXED, title, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        except sqlite3.OperationalError:
+            return False
+        self._db.execute("INSERT INTO track_titles (id, title) SELECT id, json_extract(info, '$.title') FROM tracks")
+        return True
+
+    # Memory tier
+    def _remember(self, table, key, value):
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.memory_entries:
+            table.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _expired(self, stored_at):
+        return time.time() - stored_at > self.metadata_ttl
+
+    # Lookups
+    def get_query(self, query):
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is None:
+                row = self._db.execute("SELECT ids, stored_at FROM queries WHERE query = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            if self._expired(entry[1]):
+                self._queries.pop(key, None)
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return None
+            self._remember(self._queries, key, entry)
+            return entry[0]
+
+    def get_track(self, video_id):
+        with self._lock:
+            entry = self._tracks.get(video_id)
+            if entry is None:
+                row = self._db.execute("SELECT info, stored_at FROM tracks WHERE id = ?", (video_id,)).fetchone()
+                if row is not None:
+                    entry = (Track.from_dict(json.loads(row[0])), row[1])
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            if self._expired(entry[1]):
+                self._tracks.pop(video_id, None)
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return None
+            self._remember(self._tracks, video_id, entry)
+            if self.stream_is_fresh(entry[0]):
+                self.counters["hits"] += 1
+            else:
+                self.counters["stale"] += 1
+            return entry[0]
+
+    def stream_is_fresh(self, track):
+        return (
+            track.stream_url is not None
+            and track.url_expiry is not None
+            and track.url_expiry - self.stream_margin > time.time()
+        )
+
+    # Stores
+    def put_track(self, track):
+        if not track.id or not track.is_resolved:
+            return
+        if track.url_expiry is None:
+            track.url_expiry = time.time() + self.default_stream_ttl
+        # Requester is per request, never share it through the cache
+        stored = track.replace(requester=None)
+        now = time.time()
+        with self._lock:
+            self._remember(self._tracks, track.id, (stored, now))
+            self._db.execute(
+                "INSERT OR REPLACE INTO tracks (id, info, stored_at) VALUES (?, ?, ?)",
+                (track.id, json.dumps(stored.to_dict()), now)
+            )
+            if self._fts:
+                self._db.execute("DELETE FROM track_titles WHERE id = ?", (track.id,))
+                self._db.execute("INSERT INTO track_titles (id, title) VALUES (?, ?)", (track.id, track.title))
+            self._db.commit()
+
+    def put(self, query, tracks):
+        ids = []
+        for track in tracks:
+            if track.id and track.is_resolved:
+                self.put_track(track)
+                ids.append(track.id)
+        if not ids:
+            return
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            self._remember(self._queries, key, (ids, now))
+            self._db.execute(
+                "INSERT OR REPLACE INTO queries (query, ids, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(ids), now)
+            )
+            self._db.commit()
+
+    def prune(self):
+        cutoff = time.time() - self.metadata_ttl
+        with self._lock:
+            removed = self._db.execute("DELETE FROM tracks WHERE stored_at < ?", (cutoff,)).rowcount
+            removed += self._db.execute("DELETE FROM queries WHERE stored_at < ?", (cutoff,)).rowcount
+            if self._fts:
+                self._db.execute("DELETE FROM track_titles WHERE id NOT IN (SELECT id FROM tracks)")
+            self._db.commit()
+            self.counters["expirations"] += max(removed, 0)
+
+    def suggest(self, text, limit=25):
+        # [(video_id, title, duration)] of known tracks whose title matches what was typed so far
+        text = normalize_query(text)
+        if not text:
+            return []
+        with self._lock:
+            if self._fts:
+                rows = self._db.execute(
+                    "SELECT track_titles.id, track_titles.title, json_extract(tracks.info, '$.duration') "
+                    "FROM track_titles JOIN tracks ON tracks.id = track_titles.id "
+                    "WHERE track_titles MATCH ? ORDER BY rank LIMIT ?",
+                    (fts_prefix_query(text), limit)
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT id, json_extract(info, '$.title') AS title, json_extract(info, '$.duration') FROM tracks "
+                    "WHERE title LIKE ? ESCAPE '\\' ORDER BY stored_at DESC LIMIT ?",
+                    ("%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%", limit)
+                ).fetchall()
+        return rows
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_tracks"] = len(self._tracks)
+            stats["memory_queries"] = len(self._queries)
+            stats["disk_tracks"] = self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        lookups = stats["hits"] + stats["stale"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,12 +1,14 @@
 import json
+
 import discord
 from discord.ext import commands
 
 config = json.loads(open("config.json", "r").read())
+DEFAULT_FOOTER = config['default_footer']
 
 def generic_embed(title=None, description=None, color=discord.Color.blurple(), footer=None, thumbnail_url=None):
     embed = discord.Embed(title=title, description=description, color=color)
-    embed.set_footer(text=footer and footer or config['default_footer'])
+    embed.set_footer(text=footer or DEFAULT_FOOTER)
     if thumbnail_url: embed.set_thumbnail(url=thumbnail_url)
     return embed
 
@@ -15,6 +17,46 @@ def song_embed(title=None, description=None, thumbnail_url=None, color=discord.C
     
     if thumbnail_url: embed.set_thumbnail(url=thumbnail_url)
     if url: embed.url = url
-    embed.set_footer(text=footer and footer or config['default_footer'])
+    embed.set_footer(text=footer or DEFAULT_FOOTER)
     
     return embed
+
+# Templates: the arguments of the standard replies, kept in one place.
+# Constructing an Embed is cheaper than copying a prebuilt one (see benchmarks/bench_embeds.py)
+_TEMPLATES = {}
+
+def template(name, title=None, description=None, color=discord.Color.blurple()):
+    _TEMPLATES[name] = (title, description, color)
+
+def from_template(name, **fields):
+    # Fresh Embed from a template, fields (e.g. description=...) override the stored arguments
+    title, description, color = _TEMPLATES[name]
+    return generic_embed(
+        title=fields.get("title", title), description=fields.get("description", description), color=fields.get("color", color)
+    )
+
+async def respond(interaction, embed=None, ephemeral=True, **kwargs):
+    # Initial response when we still can, follow-up otherwise (e.g. after defer)
+    if embed is not None:
+        kwargs["embed"] = embed
+    if interaction.response.is_done():
+        return await interaction.followup.send(ephemeral=ephemeral, **kwargs)
+    return await interaction.response.send_message(ephemeral=ephemeral, **kwargs)
+
+template("not_in_voice", ":x: Error", "You must be in a voice channel to use this command.", discord.Color.red())
+template("not_connected", ":x: Error", "I'm not connected to any voice channel.", discord.Color.red())
+template("not_playing", ":x: Error", "No song is currently playing.", discord.Color.red())
+template("not_paused", ":x: Error", "I’m not paused right now.", discord.Color.red())
+template("no_results", ":x: Error", "No results found for your query.", discord.Color.red())
+template("empty_playlist", ":x: Error", "No tracks found in this playlist.", discord.Color.red())
+template("nothing_to_shuffle", ":x: Error", "There is nothing to shuffle.", discord.Color.red())
+template("error", ":x: Error", None, discord.Color.red())
+template("skipped", ":white_check_mark: Skipped", "Skipped the current song.", discord.Color.green())
+template("paused", ":pause_button: Paused", "Playback has been paused.", discord.Color.yellow())
+template("resumed", ":arrow_forward: Resumed", "Playback has been resumed.", discord.Color.green())
+template("stopped", ":stop_button: Stopped", "Playback has been stopped and the queue cleared.", discord.Color.red())
+template("removed", ":wastebasket: Removed", None, discord.Color.green())
+template("moved", ":arrow_up_down: Moved", None, discord.Color.green())
+template("jumped", ":fast_forward: Jumped", None, discord.Color.green())
+template("shuffled", ":twisted_rightwards_arrows: Shuffled", None, discord.Color.green())
+template("seeked", ":fast_forward: Seeked", None, discord.Color.green())
@@ -0,0 +1,52 @@
+import os
+from collections import namedtuple
+
+# Opus bitrates (kbps) we step through when degrading
+BITRATE_STEPS = (32, 48, 64, 96, 128, 160, 192, 256, 320, 384)
+
+Encoding = namedtuple("Encoding", ["bitrate", "format", "pressure"])
+
+
+def ytdl_format(bitrate):
+    # Prefer Opus so the source can be passed through, capped at the bitrate we are going to send
+    return f"bestaudio[acodec=opus][abr<={bitrate}]/bestaudio[abr<={bitrate}]/bestaudio/best"
+
+
+def host_cpu_load():
+    # 1-minute load average per core, None where the OS doesn't expose it (Windows)
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+def select_encoding(channel_bitrate=None, active_streams=0, cpu_load=None, max_bitrate=96, min_bitrate=32, stream_limit=50):
+    """Pick the encode bitrate and yt-dlp format for one guild.
+
+    Pure function, no Discord objects: ``channel_bitrate`` is the voice channel's limit
+    in bits per second, ``active_streams`` the number of ffmpeg processes currently
+    running and ``cpu_load`` the load per core (0.0 - 1.0+). The higher of stream and
+    CPU pressure steps the bitrate down from the channel/config ceiling towards
+    ``min_bitrate``.
+    """
+    ceiling = max_bitrate
+    if channel_bitrate:
+        ceiling = min(ceiling, channel_bitrate // 1000)
+    ceiling = max(ceiling, min_bitrate)
+
+    pressure = active_streams / stream_limit if stream_limit else 0.0
+    if cpu_load is not None:
+        pressure = max(pressure, cpu_load)
+
+    if pressure < 0.5:
+        target = ceiling
+    elif pressure < 0.75:
+        target = ceiling * 3 // 4
+    elif pressure < 1.0:
+        target = ceiling // 2
+    else:
+        target = min_bitrate
+
+    steps = [step for step in BITRATE_STEPS if min_bitrate <= step <= max(target, min_bitrate)]
+    bitrate = steps[-1] if steps else min_bitrate
+    return Encoding(bitrate, ytdl_format(bitrate), round(pressure, 2))
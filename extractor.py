@@ -0,0 +1,169 @@
+import asyncio
+import copy
+import itertools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import metrics
+from track import Track
+
+logger = logging.getLogger("discord")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+_local = threading.local()
+
+
+def _yt_dlp():
+    # yt-dlp takes a noticeable part of startup to import, it's loaded on first use (or by warm_up)
+    import yt_dlp
+    return yt_dlp
+
+
+def _new_ydl(ydl_opts):
+    # YoutubeDL writes into the dict it's given (e.g. adds a compat_opts set), keep the caller's untouched
+    return _yt_dlp().YoutubeDL(copy.deepcopy(ydl_opts))
+
+
+def _get_ydl(ydl_opts, max_uses):
+    # One pre-warmed YoutubeDL per worker thread/process and option set, recycled after max_uses
+    instances = getattr(_local, "instances", None)
+    if instances is None:
+        instances = _local.instances = {}
+
+    key = json.dumps(ydl_opts, sort_keys=True)
+    entry = instances.get(key)
+    if entry is not None and max_uses and entry[1] >= max_uses:
+        entry[0].close()
+        entry = None
+    if entry is None:
+        entry = instances[key] = [_new_ydl(ydl_opts), 0]
+    entry[1] += 1
+    return entry[0]
+
+
+def _extract(query, ydl_opts, max_uses=0):
+    if max_uses < 0:
+        # Pooling disabled, build a throwaway instance like before
+        with _new_ydl(ydl_opts) as ydl:
+            return _extract_with(ydl, query)
+    return _extract_with(_get_ydl(ydl_opts, max_uses), query)
+
+
+def _extract_tracks(query, ydl_opts, max_uses=0):
+    # Runs inside the worker so only compact Track records cross back to the event loop
+    info = _extract(query, ydl_opts, max_uses)
+    entries = info.get("entries") if "entries" in info else [info]
+    return {
+        "title": info.get("title"),
+        "webpage_url": info.get("webpage_url"),
+        "playlist": "entries" in info,  # False for a single video, which ignores playlist_items
+        "tracks": [Track.from_info(entry) for entry in (entries or []) if entry and entry.get("id")],
+    }
+
+
+def _warm(ydl_opts, max_uses=0):
+    # Imports yt-dlp and builds this worker's pooled instance without extracting anything
+    if max_uses >= 0:
+        _get_ydl(ydl_opts, max_uses)
+    else:
+        _yt_dlp()
+
+
+def _extract_with(ydl, query):
+    try:
+        return ydl.extract_info(query, download=False)
+    except _yt_dlp().utils.DownloadError as e:
+        if "Requested format is not available" in str(e):
+            raise ValueError("This video might be DRM-protected or region-locked.")
+        raise
+
+
+class ExtractionService:
+    """Bounded yt-dlp worker pool with a priority queue and single-flight coalescing."""
+
+    def __init__(self, workers=4, use_processes=False, ydl_max_uses=50):
+        self.workers = workers
+        self.use_processes = use_processes
+        self.ydl_max_uses = ydl_max_uses
+        self._executor = None
+        self._queue = None
+        self._tasks = []
+        self._inflight = {}
+        self._order = itertools.count()
+        self.counters = {"submitted": 0, "coalesced": 0, "completed": 0, "failed": 0}
+
+    def _start(self):
+        if self.use_processes:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="yt-dlp")
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Extraction pool started with {self.workers} {'process' if self.use_processes else 'thread'} workers.")
+
+    async def extract_tracks(self, query, ydl_opts, priority=PRIORITY_INTERACTIVE):
+        return await self._submit(_extract_tracks, query, ydl_opts, priority)
+
+    async def warm_up(self, ydl_opts):
+        if self._queue is None:
+            self._start()
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._executor, _warm, ydl_opts, self.ydl_max_uses) for _ in range(self.workers)
+        ))
+        logger.info(f"Extraction pool warmed up in {time.perf_counter() - start:.2f}s.")
+
+    async def _submit(self, fn, query, ydl_opts, priority):
+        if self._queue is None:
+            self._start()
+
+        key = (fn.__name__, query, json.dumps(ydl_opts, sort_keys=True))
+        future = self._inflight.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.counters["submitted"] += 1
+        await self._queue.put((priority, next(self._order), key, fn, query, ydl_opts, future))
+        return await asyncio.shield(future)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, key, fn, query, ydl_opts, future = await self._queue.get()
+            try:
+                with metrics.timer("musicbot_extraction_seconds", kind=fn.__name__.strip("_")):
+                    result = await loop.run_in_executor(self._executor, fn, query, ydl_opts, self.ydl_max_uses)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                self.counters["failed"] += 1
+                future.set_exception(e)
+            else:
+                self.counters["completed"] += 1
+                future.set_result(result)
+            finally:
+                self._inflight.pop(key, None)
+                self._queue.task_done()
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._queue = None
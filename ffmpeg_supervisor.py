@@ -0,0 +1,342 @@
+import asyncio
+import contextlib
+import inspect
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+import discord
+
+import metrics
+
+logger = logging.getLogger("discord")
+
+BUNDLED_WINDOWS_FFMPEG = os.path.join("bin", "ffmpeg", "ffmpeg.exe")
+FRAME_SECONDS = 0.02  # discord.py reads one 20ms Opus frame per packet it sends
+
+try:
+    _CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _CLOCK_TICKS = _PAGE_SIZE = None
+
+
+def find_ffmpeg(configured=None):
+    # Configured path or name, then the build bundled for Windows, then whatever is on PATH
+    candidates = [configured] if configured else []
+    if sys.platform == "win32":
+        candidates.append(BUNDLED_WINDOWS_FFMPEG)
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+        found = shutil.which(candidate)
+        if found:
+            return found
+    return shutil.which("ffmpeg") or "ffmpeg"
+
+
+def process_usage(pid):
+    # (CPU seconds, RSS bytes) of a process from /proc, None where there is no procfs
+    if _CLOCK_TICKS is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces, fields are counted from after its closing parenthesis
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS, rss_pages * _PAGE_SIZE
+
+
+def _usage_by_key(processes):
+    # Sums process_usage over (key, pid) pairs into key -> (CPU seconds, RSS bytes)
+    usage = {}
+    for key, pid in processes:
+        sample = process_usage(pid)
+        if sample is not None:
+            cpu, rss = usage.get(key, (0.0, 0))
+            usage[key] = (cpu + sample[0], rss + sample[1])
+    return usage
+
+
+def apply_limits(pid, nice=0, rlimits=None):
+    # Lowers the priority and sets resource limits of an already running process, no-op where unsupported
+    if nice and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, nice)
+        except OSError as e:
+            logger.debug(f"Could not renice ffmpeg process {pid}: {e}")
+    if not rlimits:
+        return
+    try:
+        import resource
+    except ImportError:
+        return
+    if not hasattr(resource, "prlimit"):
+        return
+    for name, value in rlimits.items():
+        if not value:
+            continue
+        try:
+            resource.prlimit(pid, getattr(resource, "RLIMIT_" + name.upper()), (value, value))
+        except (AttributeError, ValueError, OSError) as e:
+            logger.debug(f"Could not set RLIMIT_{name.upper()} on ffmpeg process {pid}: {e}")
+
+
+async def probed_opus_audio(source, bitrate, executable="ffmpeg", **options):
+    # FFmpegOpusAudio.from_probe passes the probed bitrate to the constructor itself, so ours
+    # can't be given to it; probe for the codec and build the source with our bitrate instead
+    codec, _ = await discord.FFmpegOpusAudio.probe(source, method="fallback", executable=executable)
+    return discord.FFmpegOpusAudio(source, codec=codec, bitrate=bitrate, executable=executable, **options)
+
+
+def _process_of(source):
+    # FFmpegAudio keeps its Popen in _process, set to a falsy sentinel once cleaned up
+    return getattr(source, "_process", None) or None
+
+
+class SupervisedSource(discord.AudioSource):
+    """Audio source around an ffmpeg source that the supervisor can restart mid-track.
+
+    Counts the frames handed to the voice client, so ``position`` is the playback
+    position in the track and a restart can seek back to it. When the underlying
+    process is replaced while the player thread is blocked reading the old pipe, the
+    empty read is retried on the new one instead of ending the track.
+    """
+
+    def __init__(self, supervisor, spawn, inner, key=None, duration=None, offset=0.0):
+        self.key = key
+        self.duration = duration
+        self.offset = offset
+        self.frames = 0
+        self.restarts = 0
+        self.created = time.monotonic()
+        self.last_read = None  # monotonic time of the last frame, None until the voice client starts reading
+        self.closed = False
+        self.abandoned = False  # given up on by the supervisor, the player must not resume it
+        self._supervisor = supervisor
+        self._spawn = spawn
+        self._inner = inner
+        self._lock = threading.Lock()
+        # Kept after cleanup (which drops the source's own reference) so the reaper can check it exited
+        self.process = _process_of(inner)
+
+    @property
+    def position(self) -> float:
+        return self.offset + self.frames * FRAME_SECONDS
+
+    def read(self) -> bytes:
+        inner = self._inner
+        data = inner.read()
+        if not data and not self.closed and self._inner is not inner:
+            data = self._inner.read()
+        if data:
+            self.frames += 1
+            self.last_read = time.monotonic()
+        return data
+
+    def is_opus(self) -> bool:
+        return self._inner.is_opus()
+
+    def replace(self, inner, offset):
+        with self._lock:
+            old, self._inner = self._inner, inner
+            self.process = _process_of(inner)
+            self.offset, self.frames = offset, 0
+            self.last_read = time.monotonic()
+            self.restarts += 1
+        old.cleanup()
+
+    def cleanup(self):
+        with self._lock:
+            self.closed = True
+            inner = self._inner
+        inner.cleanup()
+
+    def abandon(self):
+        # Ends the track for good: the voice client sees EOF and moves on to the next one
+        self.abandoned = True
+        self.cleanup()
+
+
+class FFmpegSupervisor:
+    """Owns every ffmpeg process spawned for playback.
+
+    ``open`` waits for a free slot under ``max_processes``, spawns the source, lowers
+    its priority and applies rlimits, and returns a ``SupervisedSource``. ``monitor``
+    periodically samples CPU/RSS, reaps processes whose source was dropped without
+    being played, and restarts streams that stopped producing frames at the position
+    they reached. ``owned()`` returns the sources still in use (playing or prepared),
+    ``is_playing(key)`` whether the voice client for ``key`` is currently sending.
+    Other ffmpeg runs go through ``subprocess`` so they count against the same cap.
+    """
+
+    def __init__(self, executable, max_processes=0, nice=0, rlimits=None, slot_timeout=30, stall_timeout=10,
+                 monitor_interval=5, orphan_grace=30, max_restarts=3, end_margin=5, owned=None, is_playing=None):
+        self.executable = executable
+        self.max_processes = max_processes
+        self.nice = nice
+        self.rlimits = rlimits or {}
+        self.slot_timeout = slot_timeout
+        self.stall_timeout = stall_timeout
+        self.monitor_interval = monitor_interval
+        self.orphan_grace = orphan_grace
+        self.max_restarts = max_restarts
+        self.end_margin = end_margin  # a stream this close to the track's end counts as finished
+        self._owned = owned or (lambda: ())
+        self._is_playing = is_playing or (lambda key: True)
+        self._sources = set()
+        self._killed = set()  # closed sources whose leftover process was killed, forgotten once it exited
+        self._spawning = 0
+        self._external = 0  # processes started through subprocess(), e.g. audio cache encodes
+        self.usage = {}  # key -> (CPU seconds, RSS bytes) of its live ffmpeg processes, refreshed by monitor
+        self.counters = {"spawned": 0, "restarted": 0, "reaped": 0, "orphans": 0}
+
+    def running(self) -> int:
+        return sum(1 for source in self._sources if not source.closed) + self._spawning + self._external
+
+    async def _wait_for_slot(self):
+        if not self.max_processes:
+            return
+        started = time.perf_counter()
+        while self.running() >= self.max_processes:
+            await self.reap()
+            if self.running() < self.max_processes:
+                break
+            if time.perf_counter() - started >= self.slot_timeout:
+                raise RuntimeError(f"{self.running()} ffmpeg processes running, the limit is {self.max_processes}.")
+            await asyncio.sleep(0.25)
+        metrics.observe("musicbot_ffmpeg_slot_wait_seconds", time.perf_counter() - started)
+
+    async def _spawn_process(self, spawn, offset, reason):
+        # spawn(offset) returns an FFmpegAudio or a coroutine resolving to one
+        if reason != "restart":
+            # A restart replaces a process that already holds a slot
+            await self._wait_for_slot()
+        self._spawning += 1
+        try:
+            with metrics.timer("musicbot_ffmpeg_spawn_seconds", reason=reason):
+                inner = spawn(offset)
+                if inspect.isawaitable(inner):
+                    inner = await inner
+        finally:
+            self._spawning -= 1
+        process = _process_of(inner)
+        if process is not None:
+            apply_limits(process.pid, self.nice, self.rlimits)
+        self.counters["spawned"] += 1
+        return inner
+
+    @contextlib.asynccontextmanager
+    async def subprocess(self, *args, reason="subprocess", **kwargs):
+        # ffmpeg runs outside playback get the same slot cap, limits and spawn timing;
+        # the slot is held until the block exits, and a process still running then is killed
+        await self._wait_for_slot()
+        self._external += 1
+        try:
+            with metrics.timer("musicbot_ffmpeg_spawn_seconds", reason=reason):
+                process = await asyncio.create_subprocess_exec(self.executable, *args, **kwargs)
+            apply_limits(process.pid, self.nice, self.rlimits)
+            self.counters["spawned"] += 1
+            try:
+                yield process
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+        finally:
+            self._external -= 1
+
+    async def open(self, spawn, key=None, duration=None, offset=0.0) -> SupervisedSource:
+        inner = await self._spawn_process(spawn, offset, "start")
+        source = SupervisedSource(self, spawn, inner, key=key, duration=duration, offset=offset)
+        self._sources.add(source)
+        return source
+
+    async def restart(self, source, offset=None):
+        # Replaces the process behind a source, by default resuming where playback stopped
+        offset = source.position if offset is None else offset
+        inner = await self._spawn_process(source._spawn, offset, "restart")
+        if source.closed:
+            inner.cleanup()
+            return
+        source.replace(inner, offset)
+        self.counters["restarted"] += 1
+
+    async def reap(self):
+        # Forgets sources whose process is gone and kills the ones nobody plays or prepared any more.
+        # Nothing here may wait on a process: a killed one is only polled and forgotten by a later reap,
+        # and orphan cleanups, which wait for ffmpeg to exit, run in a thread
+        owned = set(map(id, self._owned()))
+        now = time.monotonic()
+        orphans = []
+        for source in list(self._sources):
+            process = source.process
+            if source.closed or process is None:
+                if process is not None and process.poll() is None:
+                    if source not in self._killed:
+                        logger.warning(f"Reaping ffmpeg process {process.pid} left running after cleanup (guild {source.key}).")
+                        process.kill()
+                        self._killed.add(source)
+                        self.counters["reaped"] += 1
+                    continue
+                self._killed.discard(source)
+                self._sources.discard(source)
+            elif id(source) not in owned and now - source.created >= self.orphan_grace:
+                logger.warning(f"Killing orphaned ffmpeg process {process.pid} (guild {source.key}).")
+                self._sources.discard(source)
+                self.counters["orphans"] += 1
+                orphans.append(source)
+        for source in orphans:
+            await asyncio.to_thread(source.cleanup)
+
+    async def _sample(self):
+        # The /proc reads run in a thread on a snapshot taken here, the set may change meanwhile
+        processes = [(source.key, source.process.pid) for source in self._sources
+                     if not source.closed and source.process is not None]
+        self.usage = await asyncio.to_thread(_usage_by_key, processes)
+
+    def _stalled(self):
+        now = time.monotonic()
+        stalled = []
+        for source in self._sources:
+            if source.closed or source.last_read is None:
+                continue
+            if not self._is_playing(source.key):
+                # Paused, nothing reads frames; don't count that time as a stall
+                source.last_read = now
+            elif now - source.last_read >= self.stall_timeout:
+                stalled.append(source)
+        return stalled
+
+    async def monitor(self):
+        while True:
+            await asyncio.sleep(self.monitor_interval)
+            await self.reap()
+            await self._sample()
+            for source in self._stalled():
+                if source.duration and source.position >= source.duration - self.end_margin:
+                    # Stuck right before the end, finishing the track is better than replaying its tail
+                    source.abandon()
+                    continue
+                if source.restarts >= self.max_restarts:
+                    logger.error(f"ffmpeg stream for guild {source.key} keeps stalling, skipping the track.")
+                    source.abandon()
+                    continue
+                logger.warning(f"ffmpeg stream stalled for guild {source.key}, restarting at {source.position:.1f}s.")
+                try:
+                    await self.restart(source)
+                except Exception as e:
+                    logger.error(f"Failed to restart stalled stream for guild {source.key}: {e}")
+                    source.abandon()
+
+    def close(self):
+        for source in list(self._sources):
+            source.cleanup()
+        self._sources.clear()
+        self._killed.clear()
@@ -0,0 +1,283 @@
+import logging
+import queue
+import sys
+import time
+
+from PyQt5 import QtCore, QtWidgets, uic
+
+
+class ActivityTableModel(QtCore.QAbstractTableModel):
+    HEADERS = ["Guild Name", "Status", "Now Playing"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self._index = {}  # guild_id -> row number
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        guild = self.rows[index.row()]
+        column = index.column()
+
+        # Guild Name
+        if column == 0:
+            return guild["name"]
+
+        # Voice Status
+        if column == 1:
+            if guild["status"] == "Inactive":
+                return "Inactive"
+            elif guild["status"] == "Paused":
+                return f"Paused ({guild['channel']})"
+            return f"Active ({guild['channel']})"
+
+        # Now Playing
+        if not guild["title"]:
+            return "None"
+        if guild["duration"]:
+            mins, secs = divmod(guild["duration"], 60)
+            duration_str = f"{int(mins):02d}:{int(secs):02d}"
+        else:
+            duration_str = "Unknown"
+        return f"{guild['title']} ({duration_str})"
+
+    def row_for(self, row):
+        if 0 <= row < len(self.rows):
+            return self.rows[row]
+        return None
+
+    def apply(self, event):
+        kind, data = event
+        if kind == "snapshot":
+            self.beginResetModel()
+            self.rows = list(data)
+            self._index = {row["guild_id"]: i for i, row in enumerate(self.rows)}
+            self.endResetModel()
+
+        elif kind == "update":
+            row = self._index.get(data["guild_id"])
+            if row is None:
+                row = len(self.rows)
+                self.beginInsertRows(QtCore.QModelIndex(), row, row)
+                self.rows.append(data)
+                self._index[data["guild_id"]] = row
+                self.endInsertRows()
+            else:
+                self.rows[row] = data
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+
+        elif kind == "remove":
+            row = self._index.pop(data, None)
+            if row is None:
+                return
+            self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+            del self.rows[row]
+            self.endRemoveRows()
+            for guild_id, i in self._index.items():
+                if i > row:
+                    self._index[guild_id] = i - 1
+
+
+class MainWindow(QtWidgets.QMainWindow):
+    # Upper bound of feed events applied per timer tick, keeps the UI responsive during bursts
+    MAX_EVENTS_PER_TICK = 500
+
+    def __init__(self, app_logic):
+        while app_logic.check_bot_status() != "online":
+            time.sleep(0.1)
+
+        super().__init__()
+        self.app_logic = app_logic
+
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose, True)
+
+        uic.loadUi("ui/main.ui", self)
+        self.functionality()
+
+    def functionality(self):
+        user, user_id = self.app_logic.bot_identity()
+        self.setWindowTitle(f"Discord Bot Control Panel - {user}")
+
+        self.is_debug = self.app_logic.conf['debug']
+
+        self.stop_btn.clicked.connect(self.on_stop)
+        self.actionShutdown.triggered.connect(self.on_stop)
+        self.actionEnable_Debug.setChecked(self.is_debug)
+        self.actionEnable_Debug.triggered.connect(self.toggle_debug)
+        self.label_bot_details.setText(f"Logged in as {user} (ID: {user_id})")
+
+        # Activity Table, fed by state-change events published from the bot loop
+        self.activity_model = ActivityTableModel(self)
+        self.table_activity.setModel(self.activity_model)
+        self.table_activity.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table_activity.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.feed = self.app_logic.state_feed()
+        self.feed_events = self.feed.subscribe()
+        self.drain_feed()
+
+        self.activity_timer = QtCore.QTimer(self)
+        self.activity_timer.timeout.connect(self.drain_feed)
+        self.activity_timer.start(self.app_logic.conf['GUI']['table_refresh_interval'])
+
+        self.stats_timer = QtCore.QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats)
+        self.stats_timer.start(self.app_logic.conf['GUI']['stats_refresh_interval'])
+        self.update_stats()
+
+        # Add right-click context menu
+        self.table_activity.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
+        self.table_activity.customContextMenuRequested.connect(self.show_activity_context_menu)
+
+    def drain_feed(self):
+        status = self.app_logic.check_bot_status()
+        self.label_status.setText(status.upper())
+        if status == 'online':
+            self.label_status.setStyleSheet("color: green;")
+        else:
+            self.label_status.setStyleSheet("color: red;")
+
+        for _ in range(self.MAX_EVENTS_PER_TICK):
+            try:
+                event = self.feed_events.get_nowait()
+            except queue.Empty:
+                break
+            self.activity_model.apply(event)
+
+        self.label_active.setText(f"ACTIVE: {self.feed.active_count()}")
+        if not self.table_activity.selectionModel().hasSelection() and self.activity_model.rows:
+            self.table_activity.selectRow(0)
+
+    def refresh_activity_table(self):
+        # Resubscribe to get a fresh full snapshot
+        self.feed.unsubscribe(self.feed_events)
+        self.feed_events = self.feed.subscribe()
+        self.drain_feed()
+
+    def closeEvent(self, event):
+        self.feed.unsubscribe(self.feed_events)
+        super().closeEvent(event)
+
+    def selected_guild(self):
+        return self.activity_model.row_for(self.table_activity.currentIndex().row())
+
+    def show_activity_context_menu(self, pos):
+        menu = QtWidgets.QMenu(self)
+        action_refresh = menu.addAction("Refresh Table Info")
+        menu.addSeparator()
+        action_copy_id = menu.addAction("Copy Guild ID")
+
+        guild = self.selected_guild()
+        action_pause_song = menu.addAction("Pause Song")
+        action_play_song = menu.addAction("Resume Song")
+        action_skip_song = menu.addAction("Skip Song")
+        action_disconnect = menu.addAction("Disconnect")
+
+        action_pause_song.setVisible(False)
+        action_play_song.setVisible(False)
+        action_skip_song.setVisible(False)
+        action_disconnect.setVisible(False)
+
+        if guild is not None:
+            status = guild["status"]
+            if status == "Playing":
+                action_pause_song.setVisible(True)
+            elif status == "Paused":
+                action_play_song.setVisible(True)
+
+            if status == "Playing" or status == "Paused":
+                action_skip_song.setVisible(True)
+            if status != "Inactive":
+                action_disconnect.setVisible(True)
+
+        action = menu.exec_(self.table_activity.viewport().mapToGlobal(pos))
+
+        # Refresh the activity table
+        if action == action_refresh:
+            self.refresh_activity_table()
+            return
+
+        guild = self.selected_guild()
+        if action is None:
+            return
+        if guild is None:
+            self.app_logic.logger.warning("No guild selected.")
+            return
+
+        # Copy the guild ID to clipboard
+        if action == action_copy_id:
+            QtWidgets.QApplication.clipboard().setText(str(guild["guild_id"]))
+
+        # Disconnect from the voice channel
+        elif action == action_disconnect:
+            self.app_logic.guild_command(guild["guild_id"], "disconnect")
+
+        # Skip song in the selected guild
+        elif action == action_skip_song:
+            self.app_logic.guild_command(guild["guild_id"], "skip")
+
+        # Pause song in the selected guild
+        elif action == action_pause_song:
+            self.app_logic.guild_command(guild["guild_id"], "pause")
+
+        # Resume song in the selected guild
+        elif action == action_play_song:
+            self.app_logic.guild_command(guild["guild_id"], "resume")
+
+    def update_stats(self):
+        if self.app_logic.check_bot_status() != 'online': return
+        wanted = ("musicbot_search_seconds", "musicbot_track_load_seconds", "musicbot_transition_gap_seconds", "musicbot_event_loop_lag_seconds")
+        lines = []
+        for title, summary in self.app_logic.metrics_summary():
+            picked = [line for line in summary if line.startswith(wanted)]
+            lines.append(f"{title}: " + (" | ".join(picked) if picked else "no samples yet"))
+        self.label_stats.setText("\n".join(lines))
+
+    def toggle_debug(self):
+        is_checked = self.actionEnable_Debug.isChecked()
+        self.app_logic.conf['debug'] = is_checked
+        self.app_logic.logger.setLevel(logging.DEBUG if is_checked else logging.INFO)
+        self.app_logic.logger.info("Debug mode enabled." if is_checked else "Debug mode disabled.")
+
+
+    def on_stop(self):
+        if self.app_logic.check_bot_status() != "online":
+            self.app_logic.logger.warning("Bot is not running. No action taken.")
+            return
+        
+        reply = QtWidgets.QMessageBox.question(
+            self,
+            "Confirm Stop",
+            "Are you sure you want to stop the bot?",
+            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
+            QtWidgets.QMessageBox.No
+        )
+        if reply == QtWidgets.QMessageBox.Yes:
+            self.app_logic.stop_bot()
+            QtWidgets.QMessageBox.information(self, "Info", "Stop command sent to bot.")
+
+def run_window(app_logic):
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication(sys.argv)
+        window = MainWindow(app_logic)
+        window.show()
+        app.exec_()
+    else:
+        window = MainWindow(app_logic)
+        window.show()
+
+
+def is_gui_open() -> bool:
+    return QtWidgets.QApplication.instance() is not None
@@ -0,0 +1,182 @@
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+
+class BatchingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that buffers formatted records and writes them in one go.
+
+    The buffer is written when it holds ``batch_size`` records, on ERROR and above,
+    or when ``flush`` is called (the log writer thread does so every flush interval).
+    """
+
+    def __init__(self, *args, batch_size=64, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self._buffer = []
+
+    def emit(self, record):
+        try:
+            self._buffer.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._buffer) >= self.batch_size or record.levelno >= logging.ERROR:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._buffer:
+                data = "".join(self._buffer)
+                self._buffer.clear()
+                if self.stream is None:
+                    self.stream = self._open()
+                # Rollover is checked once per batch instead of once per record
+                if self.maxBytes > 0 and self.stream.tell() + len(data.encode(self.encoding or "utf-8")) >= self.maxBytes:
+                    self.doRollover()
+                self.stream.write(data)
+            super().flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class DuplicateFilter(logging.Filter):
+    """Lets the first of identical records through and drops repeats for ``window`` seconds.
+
+    The next record after the window notes how many copies were dropped. Only used
+    from the log writer thread, so it keeps no lock.
+    """
+
+    def __init__(self, window=5.0, max_keys=1024):
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        self._seen = OrderedDict()  # (logger, level, message) -> [first emitted at, suppressed count]
+        self.suppressed = 0
+
+    def filter(self, record):
+        if self.window <= 0:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        entry = self._seen.get(key)
+        if entry is not None and now - entry[0] < self.window:
+            entry[1] += 1
+            self.suppressed += 1
+            return False
+        if entry is not None and entry[1]:
+            record.msg = f"{record.getMessage()} (repeated {entry[1]} more times)"
+            record.args = None
+        self._seen[key] = [now, 0]
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_keys:
+            self._seen.popitem(last=False)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line, for log shippers
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class TracebackQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback in ``exc_text`` instead of folding it into ``msg``.
+
+    The stock ``prepare`` merges message and traceback into one string, which leaves
+    JsonFormatter nothing to put in its "exception" field. Plain formatters still
+    append ``exc_text`` after the message, so text logs look the same.
+    """
+
+    _formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+        # Only formatted strings cross the queue (and process boundaries in sharded mode)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class LogPipeline:
+    """Moves log I/O off the event loop.
+
+    Loggers get ``queue_handler``, which only enqueues; one writer thread drops
+    duplicates, passes the records to the real handlers and flushes them every
+    ``flush_interval`` seconds.
+    """
+
+    def __init__(self, handlers, flush_interval=1.0, duplicate_window=5.0):
+        self.handlers = list(handlers)
+        self.flush_interval = flush_interval
+        self.duplicates = DuplicateFilter(duplicate_window)
+        self.queue = queue.SimpleQueue()
+        self.queue_handler = TracebackQueueHandler(self.queue)
+        self._thread = None
+        self._stopping = object()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = None
+            if record is self._stopping:
+                break
+            if record is not None:
+                self.handle(record)
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+        self.flush()
+
+    def handle(self, record):
+        if not self.duplicates.filter(record):
+            return
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def flush(self):
+        for handler in self.handlers:
+            try:
+                handler.flush()
+            except Exception:
+                pass
+
+    def stop(self, timeout=5):
+        if self._thread is None:
+            return
+        self.queue.put(self._stopping)
+        self._thread.join(timeout)
+        self._thread = None
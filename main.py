@@ -1,17 +1,22 @@
+import time
+PROCESS_STARTED = time.perf_counter()  # before any other import, for the startup report
+
 import logging
 import logging.handlers
 import colorlog
 import json
 import threading
 import asyncio
-import time
 import sys
 import gc
 import os
 
-from PyQt5 import QtCore, QtWidgets, uic
-
 import bot
+import log_pipeline
+import metrics
+import shards
+
+bot.STARTUP["process_started"] = PROCESS_STARTED
 
 class MusicBotApp:
     def __init__(self):
@@ -21,22 +26,33 @@ class MusicBotApp:
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
         self.console_thread = None
+        self.supervisor = None
+        if self.conf['sharding']['mode'] == "processes":
+            self.supervisor = shards.ShardSupervisor(
+                processes=self.conf['sharding']['processes'],
+                shard_count=self.conf['sharding']['shard_count'],
+                log_handlers=[self.log_pipeline.queue_handler],
+                log_level=self.logger.level,
+            )
         
     def setup_logger(self):
         logger = logging.getLogger("discord")
         logger.setLevel(logging.DEBUG if self.conf['debug'] else logging.INFO)
-        handler = logging.handlers.RotatingFileHandler(
+        handler = log_pipeline.BatchingRotatingFileHandler(
             filename=self.conf['logging']['file'],
             encoding="utf-8",
             maxBytes=1024 * 1024 * self.conf['logging']['file_size_mb'],
             backupCount=self.conf['logging']['backup_count'],
+            batch_size=self.conf['logging']['batch_size'],
         )
-        formatter = logging.Formatter(
-            fmt="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-            datefmt=self.conf["logging"]['datefmt']
-        )
+        if self.conf['logging']['json']:
+            formatter = log_pipeline.JsonFormatter(datefmt=self.conf["logging"]['datefmt'])
+        else:
+            formatter = logging.Formatter(
+                fmt="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+                datefmt=self.conf["logging"]['datefmt']
+            )
         handler.setFormatter(formatter)
-        logger.addHandler(handler)
 
         # Console logging
         logging.getLogger().handlers.clear()
@@ -70,16 +86,28 @@ class MusicBotApp:
                 }
             })
         console_handler.setFormatter(console_formatter)
-        logger.addHandler(console_handler)
+
+        # File and console I/O happen on the log writer thread, the event loop only enqueues records
+        self.log_pipeline = log_pipeline.LogPipeline(
+            [handler, console_handler],
+            flush_interval=self.conf['logging']['flush_interval'],
+            duplicate_window=self.conf['logging']['duplicate_window'],
+        )
+        self.log_pipeline.start()
+        logger.addHandler(self.log_pipeline.queue_handler)
 
         return logger
 
     def stop_bot(self):
         self.logger.info("Stopping bot...")
 
+        if self.supervisor is not None:
+            threading.Thread(target=self.supervisor.stop, name="ShardShutdown", daemon=True).start()
+            return
+
         async def shutdown():
             try:
-                await bot.bot.close()
+                await bot.shutdown()
                 await asyncio.sleep(0.5)
                 pending = [t for t in asyncio.all_tasks(self.loop) if t is not asyncio.current_task(self.loop)]
                 if pending:
@@ -116,6 +144,36 @@ class MusicBotApp:
                         window_thread = threading.Thread(target=run_window, args=(self,), daemon=True)
                         window_thread.start()
 
+                elif cmd == "shards":
+                    if self.supervisor is None:
+                        self.logger.info(f"Single process, shards: {bot.bot.shard_count or 1}")
+                    else:
+                        for index, shard_ids in enumerate(self.supervisor.layout):
+                            state = self.supervisor.state.get(index, {})
+                            self.logger.info(
+                                f"Worker {index} shards={shard_ids} ready={state.get('ready', False)} "
+                                f"guilds={self.supervisor.guild_count(index)} voice={state.get('voice_clients', 0)}"
+                            )
+
+                elif cmd == "cache" and self.supervisor is not None:
+                    for index, state in sorted(self.supervisor.state.items()):
+                        for name in ("search_cache", "extraction"):
+                            counters = state.get(name, {})
+                            self.logger.info(f"Worker {index} {name}: " + ", ".join(f"{k}={v}" for k, v in counters.items()))
+
+                elif cmd == "cache":
+                    stats = bot.SEARCH_CACHE.stats()
+                    self.logger.info("Search cache: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+                    if bot.AUDIO_CACHE is not None:
+                        self.logger.info("Audio cache: " + ", ".join(f"{k}={v}" for k, v in bot.AUDIO_CACHE.stats().items()))
+                    self.logger.info("Extraction pool: " + ", ".join(f"{k}={v}" for k, v in bot.EXTRACTOR.counters.items()) + f", pending={bot.EXTRACTOR.pending()}")
+                    if bot.QUEUE_STORE is not None:
+                        self.logger.info("Queue store: " + ", ".join(f"{k}={v}" for k, v in bot.QUEUE_STORE.stats().items()))
+
+                elif cmd == "stats":
+                    for title, lines in self.metrics_summary():
+                        self.logger.info(f"{title}:\n  " + "\n  ".join(lines or ["no samples yet"]))
+
                 elif cmd == "clear":
                     if sys.platform == "win32":
                         _ = os.system('cls')
@@ -130,6 +188,8 @@ class MusicBotApp:
     def run(self) -> None:
         self.console_thread = threading.Thread(target=self.console, name="ConsoleThread", daemon=True)
         self.console_thread.start()
+        if self.supervisor is not None:
+            return self.run_sharded()
         try:
             coro = bot.run_bot(self.loop)
             if not asyncio.iscoroutine(coro):
@@ -142,285 +202,69 @@ class MusicBotApp:
             gc.collect()
             self.logger.info("Event loop closed.")
 
+    def run_sharded(self) -> None:
+        self.supervisor.start()
+        try:
+            while self.supervisor.is_alive():
+                self.supervisor.poll(timeout=0.5)
+        except KeyboardInterrupt:
+            self.supervisor.stop()
+        self.logger.info("All shard workers exited.")
+
     def check_bot_status(self) -> str:
+        if self.supervisor is not None: return self.supervisor.status()
         if bot.bot.is_closed(): return "offline"
         elif not bot.is_ready: return "starting"
         else: return "online"
 
-class MainWindow(QtWidgets.QMainWindow):
-    def __init__(self, app_logic):
-        while not bot.is_ready:
-            time.sleep(0.1)
-
-        super().__init__()
-        self.app_logic = app_logic
-
-        self.setAttribute(QtCore.Qt.WA_DeleteOnClose, True)
-
-        uic.loadUi("ui/main.ui", self)
-        self.functionality()
-
-    def functionality(self):
-        self.setWindowTitle(f"Discord Bot Control Panel - {bot.bot.user.name}")
-
-        self.is_debug = self.app_logic.conf['debug']
-
-        self.stop_btn.clicked.connect(self.on_stop)
-        self.actionShutdown.triggered.connect(self.on_stop)
-        self.actionEnable_Debug.setChecked(self.is_debug)
-        self.actionEnable_Debug.triggered.connect(self.toggle_debug)
-        self.label_bot_details.setText(f"Logged in as {bot.bot.user} (ID: {bot.bot.user.id})")
-
-        # Activity Table
-        HeaderLabels = ["Guild Name", "Status", "Now Playing"]
-        self.table_activity.setColumnCount(len(HeaderLabels))
-        self.table_activity.setHorizontalHeaderLabels(HeaderLabels)
-        self.refresh_activity_table()
-
-        # Refresh activity table
-        self.activity_timer = QtCore.QTimer(self)
-        self.activity_timer.timeout.connect(self.refresh_activity_table)
-        self.activity_timer.start(self.app_logic.conf['GUI']['table_refresh_interval'])
-
-        # Add right-click context menu
-        self.table_activity.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
-        self.table_activity.customContextMenuRequested.connect(self.show_activity_context_menu)
-        self.table_activity.clicked.connect(lambda _: self.refresh_activity_table())
-
-    def refresh_activity_table(self):
-        # Save current selection
-        selected_row = self.table_activity.currentRow()
+    # State and control shared by the console and the GUI, in both single and multi-process mode
+    def state_feed(self):
+        if self.supervisor is not None:
+            return self.supervisor.feed
+        return bot.GUILD_FEED
+
+    def guild_rows(self):
+        return self.state_feed().rows()
+
+    def voice_client_count(self) -> int:
+        if self.supervisor is not None:
+            return self.supervisor.voice_client_count()
+        return len(bot.bot.voice_clients)
+
+    def bot_identity(self):
+        if self.supervisor is not None:
+            return self.supervisor.identity()
+        return str(bot.bot.user), bot.bot.user.id
+
+    def metrics_summary(self):
+        # [(title, lines)], one entry per shard worker in multi-process mode
+        if self.supervisor is not None:
+            return [(f"Worker {index}", state.get("metrics", [])) for index, state in sorted(self.supervisor.state.items())]
+        return [("Metrics", metrics.summary())]
+
+    def guild_command(self, guild_id: int, command: str):
+        if self.supervisor is not None:
+            self.supervisor.send(guild_id, command)
+            return
 
-        self.label_status.setText(self.app_logic.check_bot_status().upper())
-        if self.app_logic.check_bot_status() == 'online':
-            self.label_status.setStyleSheet("color: green;")
-        else:
-            self.label_status.setStyleSheet("color: red;")
-        self.label_active.setText(f"ACTIVE: {len(bot.bot.voice_clients)}")
-        
-        self.table_activity.setRowCount(0)
-        for guild in bot.bot.guilds:
-            row = self.table_activity.rowCount()
-            self.table_activity.insertRow(row)
-
-            # Guild Name
-            item = QtWidgets.QTableWidgetItem(guild.name)
-            item.setFlags(item.flags() & ~QtCore.Qt.ItemIsEditable)
-            self.table_activity.setItem(row, 0, item)
-
-            # Voice Status
-            voice_client = next((vc for vc in bot.bot.voice_clients if vc.guild.id == guild.id and vc.is_connected()), None)
-            if voice_client and voice_client.channel:
-                try:
-                    fut = asyncio.run_coroutine_threadsafe(
-                        bot.song_status(guild.id), self.app_logic.loop
-                    )
-                    playback_status = fut.result(timeout=2)
-                except Exception as e:
-                    self.app_logic.logger.error(f"Failed to get song status for {guild.name}: {e}")
-                    playback_status = "Unknown"
-                    
-                if playback_status == "Paused":
-                    status_text = f"Paused ({voice_client.channel.name})"
-                else:
-                    status_text = f"Active ({voice_client.channel.name})"
-            else:
-                status_text = "Inactive"
-            status_item = QtWidgets.QTableWidgetItem(status_text)
-            status_item.setFlags(status_item.flags() & ~QtCore.Qt.ItemIsEditable)
-            self.table_activity.setItem(row, 1, status_item)
-
-            # Now Playing
-            current_song = bot.CURRENT_SONG.get(str(guild.id))
-            if status_text == "Inactive":
-                song_text = "None"
-            elif current_song:
-                _, title, track = current_song
-                duration = track.get("duration") if isinstance(track, dict) else None
-                if duration:
-                    mins, secs = divmod(duration, 60)
-                    duration_str = f"{int(mins):02d}:{int(secs):02d}"
-                else:
-                    duration_str = "Unknown"
-                song_text = f"{title} ({duration_str})"
-            else:
-                song_text = "None"
-
-            now_playing_item = QtWidgets.QTableWidgetItem(song_text)
-            now_playing_item.setFlags(now_playing_item.flags() & ~QtCore.Qt.ItemIsEditable)
-            self.table_activity.setItem(row, 2, now_playing_item)
-
-        # Restore selection if possible
-        row_count = self.table_activity.rowCount()
-        if 0 <= selected_row < row_count:
-            self.table_activity.selectRow(selected_row)
-        elif row_count > 0:
-            self.table_activity.selectRow(0)
-
-    def show_activity_context_menu(self, pos):
-        menu = QtWidgets.QMenu(self)
-        action_refresh = menu.addAction("Refresh Table Info")
-        menu.addSeparator()
-        action_copy_id = menu.addAction("Copy Guild ID")
-        
-        row = self.table_activity.currentRow()
-        action_pause_song = menu.addAction("Pause Song")
-        action_play_song = menu.addAction("Resume Song")
-        action_skip_song = menu.addAction("Skip Song")
-        action_disconnect = menu.addAction("Disconnect")
-
-        action_pause_song.setVisible(False)
-        action_play_song.setVisible(False)
-        action_skip_song.setVisible(False)
-        action_disconnect.setVisible(False)
-
-        if row >= 0 and row < len(bot.bot.guilds):
-            guild = bot.bot.guilds[row]
+        def send():
+            fut = asyncio.run_coroutine_threadsafe(bot.guild_command(guild_id, command), self.loop)
             try:
-                # Use the async song_status utility to get the status
-                fut = asyncio.run_coroutine_threadsafe(
-                    bot.song_status(guild.id), self.app_logic.loop
-                )
-                status = fut.result(timeout=3)
+                fut.result(timeout=5)
+                self.logger.info(f"{command.capitalize()} command sent for guild: {guild_id}")
             except Exception as e:
-                self.app_logic.logger.error(f"Failed to get song status for {guild.name}: {e}")
-                status = "Stopped"
-            if status == "Playing":
-                action_pause_song.setVisible(True)
-            elif status == "Paused":
-                action_play_song.setVisible(True)
-                
-            if status == "Playing" or status == "Paused":
-                action_skip_song.setVisible(True)
-                action_disconnect.setVisible(True)
-                
-        action = menu.exec_(self.table_activity.viewport().mapToGlobal(pos))
-
-        # Refresh the activity table
-        if action == action_refresh:
-            self.refresh_activity_table()
-        
-        # Copy the guild ID to clipboard
-        elif action == action_copy_id:
-            row = self.table_activity.currentRow()
-            if row >= 0 and row < len(bot.bot.guilds):
-                guild_id = str(bot.bot.guilds[row].id)
-                QtWidgets.QApplication.clipboard().setText(guild_id)
-
-        # Disconnect from the voice channel
-        elif action == action_disconnect:
-            row = self.table_activity.currentRow()
-            if row >= 0 and row < len(bot.bot.guilds):
-                guild = bot.bot.guilds[row]
-                voice_client = next((vc for vc in bot.bot.voice_clients if vc.guild.id == guild.id and vc.is_connected()), None)
-                if voice_client:
-                    # Disconnect asynchronously
-                    def disconnect():
-                        fut = asyncio.run_coroutine_threadsafe(voice_client.disconnect(), self.app_logic.loop)
-                        try:
-                            fut.result(timeout=5)
-                        except Exception as e:
-                            self.app_logic.logger.error(f"Failed to disconnect from {guild.name}: {e}")
-                    threading.Thread(target=disconnect, daemon=True).start()
-                    self.app_logic.logger.info(f"Disconnect command sent for guild: {guild.name}")
-                else:
-                    self.app_logic.logger.warning(f"Bot is not connected to a voice channel in guild: {guild.name}")
-
-        # Skip song in the selected guild
-        elif action == action_skip_song:
-            row = self.table_activity.currentRow()
-            if row >= 0 and row < len(bot.bot.guilds):
-                guild = bot.bot.guilds[row]
-                def skip():
-                    fut = asyncio.run_coroutine_threadsafe(
-                        bot.skip_song(guild.id), self.app_logic.loop
-                    )
-                    try:
-                        fut.result(timeout=5)
-                        self.app_logic.logger.info(f"Skip command sent for guild: {guild.name}")
-                    except Exception as e:
-                        self.app_logic.logger.error(f"Failed to skip song in {guild.name}: {e}")
-                threading.Thread(target=skip, daemon=True).start()
-            else:
-                self.app_logic.logger.warning("No guild selected to skip song.")
-                
-        # Pause song in the selected guild
-        elif action == action_pause_song:
-            row = self.table_activity.currentRow()
-            if row >= 0 and row < len(bot.bot.guilds):
-                guild = bot.bot.guilds[row]
-                def pause():
-                    fut = asyncio.run_coroutine_threadsafe(
-                        bot.pause_song(guild.id), self.app_logic.loop
-                    )
-                    try:
-                        fut.result(timeout=5)
-                        self.app_logic.logger.info(f"Pause command sent for guild: {guild.name}")
-                    except Exception as e:
-                        self.app_logic.logger.error(f"Failed to pause song in {guild.name}: {e}")
-                threading.Thread(target=pause, daemon=True).start()
-            else:
-                self.app_logic.logger.warning("No guild selected to pause song.")
-        
-        # Resume song in the selected guild
-        elif action == action_play_song:
-            row = self.table_activity.currentRow()
-            if row >= 0 and row < len(bot.bot.guilds):
-                guild = bot.bot.guilds[row]
-                def resume():
-                    fut = asyncio.run_coroutine_threadsafe(
-                        bot.resume_song(guild.id), self.app_logic.loop
-                    )
-                    try:
-                        fut.result(timeout=5)
-                        self.app_logic.logger.info(f"Resume command sent for guild: {guild.name}")
-                    except Exception as e:
-                        self.app_logic.logger.error(f"Failed to resume song in {guild.name}: {e}")
-                threading.Thread(target=resume, daemon=True).start()
-            else:
-                self.app_logic.logger.warning("No guild selected to resume song.")
-        
-    def update_stats(self):
-        if self.app_logic.check_bot_status() != 'online': return
-        pass
-
-    def toggle_debug(self):
-        is_checked = self.actionEnable_Debug.isChecked()
-        self.app_logic.conf['debug'] = is_checked
-        self.app_logic.logger.setLevel(logging.DEBUG if is_checked else logging.INFO)
-        self.app_logic.logger.info("Debug mode enabled." if is_checked else "Debug mode disabled.")
-
-
-    def on_stop(self):
-        if self.app_logic.check_bot_status() != "online":
-            self.app_logic.logger.warning("Bot is not running. No action taken.")
-            return
-        
-        reply = QtWidgets.QMessageBox.question(
-            self,
-            "Confirm Stop",
-            "Are you sure you want to stop the bot?",
-            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
-            QtWidgets.QMessageBox.No
-        )
-        if reply == QtWidgets.QMessageBox.Yes:
-            self.app_logic.stop_bot()
-            QtWidgets.QMessageBox.information(self, "Info", "Stop command sent to bot.")
+                self.logger.error(f"Failed to {command} in guild {guild_id}: {e}")
+        threading.Thread(target=send, daemon=True).start()
 
 def run_window(app_logic):
-    app = QtWidgets.QApplication.instance()
-    if app is None:
-        app = QtWidgets.QApplication(sys.argv)
-        window = MainWindow(app_logic)
-        window.show()
-        app.exec_()
-    else:
-        window = MainWindow(app_logic)
-        window.show()
+    # PyQt5 and the .ui file are only loaded once the GUI is actually opened
+    import gui
+    gui.run_window(app_logic)
 
 
 def is_gui_open() -> bool:
-    return QtWidgets.QApplication.instance() is not None
+    gui = sys.modules.get("gui")
+    return gui is not None and gui.is_gui_open()
 
 if __name__ == "__main__":
     app_logic = MusicBotApp()
@@ -429,4 +273,7 @@ if __name__ == "__main__":
         window_thread = threading.Thread(target=run_window, args=(app_logic,), daemon=True)
         window_thread.start()
     
-    app_logic.run()
+    try:
+        app_logic.run()
+    finally:
+        app_logic.log_pipeline.stop()
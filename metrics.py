@@ -0,0 +1,210 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("discord")
+
+# Seconds, tuned for the things we time: cache hits (ms) up to cold yt-dlp searches (s)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_counters = {}    # name -> {labels: value}
+_histograms = {}  # name -> {labels: [bucket counts..., sum, count]}
+_gauges = {}      # name -> (callable returning a number or {label value: number}, label name)
+_help = {}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, help=None, **labels):
+    with _lock:
+        series = _counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+        if help:
+            _help.setdefault(name, help)
+
+
+def observe(name, seconds, help=None, **labels):
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        key = _labels(labels)
+        values = series.get(key)
+        if values is None:
+            values = series[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += seconds
+        values[-1] += 1
+        if help:
+            _help.setdefault(name, help)
+
+
+def gauge(name, fn, label=None, help=None):
+    with _lock:
+        _gauges[name] = (fn, label)
+        if help:
+            _help[name] = help
+
+
+class timer:
+    """Context manager / decorator observing the elapsed time into a histogram."""
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+    def __call__(self, fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with timer(self.name, **self.labels):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with timer(self.name, **self.labels):
+                    return fn(*args, **kwargs)
+        return wrapper
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+def _gauge_values(fn, label):
+    try:
+        value = fn()
+    except Exception as e:
+        logger.debug(f"Gauge failed: {e}")
+        return {}
+    if isinstance(value, dict):
+        return {((label, key),): number for key, number in value.items()}
+    return {(): value}
+
+
+def render() -> str:
+    # Prometheus text exposition format
+    lines = []
+    with _lock:
+        counters = {name: dict(series) for name, series in _counters.items()}
+        histograms = {name: {k: list(v) for k, v in series.items()} for name, series in _histograms.items()}
+        gauges = dict(_gauges)
+        help_text = dict(_help)
+
+    for name, series in sorted(counters.items()):
+        if name in help_text:
+            lines.append(f"# HELP {name} {help_text[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in series.items():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name, series in sorted(histograms.items()):
+        if name in help_text:
+            lines.append(f"# HELP {name} {help_text[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in series.items():
+            for bound, count in zip(DEFAULT_BUCKETS, values):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+
+    for name, (fn, label) in sorted(gauges.items()):
+        if name in help_text:
+            lines.append(f"# HELP {name} {help_text[name]}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in _gauge_values(fn, label).items():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _quantile(values, q):
+    count = values[-1]
+    if not count:
+        return 0.0
+    target = q * count
+    for bound, cumulative in zip(DEFAULT_BUCKETS, values):
+        if cumulative >= target:
+            return bound
+    return float("inf")
+
+
+def summary():
+    # Short human readable lines for the console and the GUI stats panel
+    lines = []
+    with _lock:
+        counters = {name: dict(series) for name, series in _counters.items()}
+        histograms = {name: {k: list(v) for k, v in series.items()} for name, series in _histograms.items()}
+        gauges = dict(_gauges)
+    for name, series in sorted(counters.items()):
+        lines.append(f"{name}: {sum(series.values())}")
+    for name, series in sorted(histograms.items()):
+        merged = [sum(column) for column in zip(*series.values())]
+        count = merged[-1]
+        mean = merged[-2] / count if count else 0.0
+        lines.append(
+            f"{name}: n={count} mean={mean * 1000:.1f}ms "
+            f"p50<={_quantile(merged, 0.5) * 1000:g}ms p99<={_quantile(merged, 0.99) * 1000:g}ms"
+        )
+    for name, (fn, label) in sorted(gauges.items()):
+        values = _gauge_values(fn, label)
+        if len(values) == 1 and () in values:
+            lines.append(f"{name}: {values[()]}")
+        else:
+            lines.append(f"{name}: {len(values)} series, total={sum(values.values())}")
+    return lines
+
+
+async def monitor_loop_lag(interval=0.5):
+    # How late the event loop wakes us up is how late Opus packets and gateway heartbeats run too
+    loop = asyncio.get_running_loop()
+    latest = {"lag": 0.0}
+    gauge("musicbot_event_loop_lag_last_seconds", lambda: round(latest["lag"], 6), help="Most recent event loop wake-up delay")
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        latest["lag"] = lag
+        observe("musicbot_event_loop_lag_seconds", lag, help="Event loop wake-up delay")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(host, port):
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="MetricsHTTP", daemon=True).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
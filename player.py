@@ -0,0 +1,402 @@
+import asyncio
+import enum
+import logging
+import time
+
+import discord
+
+import metrics
+from track_queue import TrackQueue
+
+logger = logging.getLogger("discord")
+
+RESUME_ATTEMPTS = 2  # automatic resumes of one track after its stream broke
+RESUME_MARGIN = 5    # seconds; a stream ending closer than this to the track's end just finished, shared with the ffmpeg supervisor
+
+
+class PlayerState(enum.Enum):
+    IDLE = "idle"
+    LOADING = "loading"
+    PLAYING = "playing"
+    PAUSED = "paused"
+
+
+class GuildPlayer:
+    """Queue and playback state of one guild, driven by a single playback loop task.
+
+    All mutations go through ``lock``; the voice client's ``after`` callback only
+    sets an event, so tracks are never started twice or dropped under concurrency.
+    """
+
+    def __init__(self, guild_id, resolve, create_source, lookahead=15, on_track_start=None, on_change=None, journal=None,
+                 idle_linger=0, seek_source=None):
+        self.guild_id = guild_id
+        self.queue = TrackQueue()
+        self.current = None
+        self.state = PlayerState.IDLE
+        self.voice_client = None
+        self.lock = asyncio.Lock()
+        self.idle_since = None  # monotonic time the queue ran dry while still connected, see reap_idle_voice in bot.py
+
+        self._resolve = resolve
+        self._create_source = create_source
+        self._lookahead = lookahead
+        self._on_track_start = on_track_start
+        self._on_change = on_change
+        self._journal = journal
+        self._idle_linger = idle_linger
+        self._seek_source = seek_source
+
+        self._task = None
+        self._finished = asyncio.Event()
+        self._finished_at = None
+        self._prefetch_task = None
+        self._prepared = None
+        self._loader_tasks = set()
+        self._started_at = None
+        self._paused_at = None
+        self._resume_at = 0.0  # offset the next track starts at, set when a saved queue is restored
+        self._skip_requested = False
+
+    def _set_state(self, state):
+        self.state = state
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def _record(self, op, data=None):
+        # Queue changes are journaled so the queue survives a restart, see queue_store.py
+        if self._journal is not None:
+            self._journal(self.guild_id, op, data)
+
+    def position(self) -> float:
+        # Seconds into the current track, not counting time spent paused
+        if self.current is None or self._started_at is None:
+            return 0.0
+        source = self.voice_client.source if self.voice_client is not None else None
+        if getattr(source, "position", None) is not None:
+            # Counted from the frames actually sent, so seeks and stalls are accounted for
+            return source.position
+        return (self._paused_at or time.monotonic()) - self._started_at
+
+    def sources(self):
+        # Audio sources this player still holds: the one playing and the prepared next one
+        sources = []
+        if self.voice_client is not None and self.voice_client.source is not None:
+            sources.append(self.voice_client.source)
+        if self._prepared is not None:
+            sources.append(self._prepared[1])
+        return sources
+
+    def restore(self, tracks, position=0.0):
+        # Called once when the player is created, before anything else touches the queue.
+        # ``position`` is how far into the first track playback got, it resumes from there
+        self.queue.extend(tracks)
+        self._record("reset", list(self.queue))
+        if position and tracks:
+            self._resume_at = position
+            self._record("position", position)
+
+    # Commands
+    async def enqueue(self, voice_client, tracks) -> bool:
+        # Returns True when the first of the given tracks starts right away
+        async with self.lock:
+            self.voice_client = voice_client
+            self.idle_since = None
+            starts_now = self.state is PlayerState.IDLE and not self.queue
+            self.queue.extend(tracks)
+            self._record("extend", tracks)
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self._run(), name=f"player-{self.guild_id}")
+            return starts_now
+
+    async def extend(self, tracks):
+        async with self.lock:
+            self.queue.extend(tracks)
+            self._record("extend", tracks)
+
+    def skip(self) -> bool:
+        if self.voice_client and (self.voice_client.is_playing() or self.voice_client.is_paused()):
+            self._skip_requested = True
+            self.voice_client.stop()
+            return True
+        return False
+
+    def pause(self) -> bool:
+        if self.state is PlayerState.PLAYING and self.voice_client and self.voice_client.is_playing():
+            self.voice_client.pause()
+            self._paused_at = time.monotonic()
+            self._set_state(PlayerState.PAUSED)
+            return True
+        return False
+
+    def resume(self) -> bool:
+        if self.state is PlayerState.PAUSED and self.voice_client and self.voice_client.is_paused():
+            self.voice_client.resume()
+            if self._paused_at is not None:
+                self._started_at += time.monotonic() - self._paused_at
+                self._paused_at = None
+            self._set_state(PlayerState.PLAYING)
+            return True
+        return False
+
+    async def seek(self, seconds) -> bool:
+        # Restarts only the audio source of the current track at ``seconds``, the stream URL is reused
+        async with self.lock:
+            if self.state not in (PlayerState.PLAYING, PlayerState.PAUSED) or self._seek_source is None:
+                return False
+            source = self.voice_client.source
+            if source is None or not await self._seek_source(source, seconds):
+                return False
+            self._started_at = time.monotonic() - seconds
+            if self._paused_at is not None:
+                self._paused_at = time.monotonic()
+            self._record("position", round(seconds, 1))
+            self._reschedule_prefetch()
+        return True
+
+    # Queue editing, positions are 0-based here and 1-based in the commands.
+    # Bounds are checked under the lock, out-of-range positions return None instead of raising
+    def _in_queue(self, *indexes) -> bool:
+        return all(0 <= index < len(self.queue) for index in indexes)
+
+    async def remove(self, index):
+        async with self.lock:
+            if not self._in_queue(index):
+                return None
+            track = self.queue.pop(index)
+            self._record("remove", index)
+            if index == 0:
+                self._reschedule_prefetch()
+            return track
+
+    async def move(self, source, destination):
+        async with self.lock:
+            if not self._in_queue(source, destination):
+                return None
+            track = self.queue.move(source, destination)
+            self._record("move", [source, destination])
+            if 0 in (source, destination):
+                self._reschedule_prefetch()
+            return track
+
+    async def jump(self, index):
+        # Drops everything before ``index`` and skips the current track so it plays next
+        async with self.lock:
+            if not self._in_queue(index):
+                return None
+            track = self.queue[index]
+            self.queue.drop_front(index)
+            self._record("jump", index)
+            self._reschedule_prefetch()
+        self.skip()
+        return track
+
+    async def shuffle(self):
+        async with self.lock:
+            self.queue.shuffle()
+            self._record("reorder", list(self.queue))
+            self._reschedule_prefetch()
+
+    async def stop(self):
+        async with self.lock:
+            self.queue.clear()
+            self._record("clear")
+            self._cancel_loaders()
+            self._cancel_prefetch()
+            if self._task is not None and self._task is not asyncio.current_task():
+                self._task.cancel()
+            self._task = None
+            self.current = None
+            self._set_state(PlayerState.IDLE)
+            if self.voice_client and (self.voice_client.is_playing() or self.voice_client.is_paused()):
+                self.voice_client.stop()
+
+    def start_loader(self, coro):
+        # Background task feeding the queue (e.g. the rest of a playlist), cancelled by stop().
+        # Several can run at once, one per playlist queued
+        task = asyncio.create_task(coro)
+        self._loader_tasks.add(task)
+        task.add_done_callback(self._loader_tasks.discard)
+
+    def _cancel_loaders(self):
+        for task in list(self._loader_tasks):
+            if task is not asyncio.current_task():
+                task.cancel()
+                self._loader_tasks.discard(task)
+
+    # Playback loop
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        resume = None  # (track, offset, attempt) when the last stream broke before the end of its track
+        try:
+            while True:
+                async with self.lock:
+                    if (not self.queue and resume is None) or not self.voice_client or not self.voice_client.is_connected():
+                        # Going idle under the lock so a concurrent enqueue starts a fresh loop
+                        self._task = None
+                        self.current = None
+                        self._set_state(PlayerState.IDLE)
+                        self._finished_at = None
+                        self._record("idle")
+                        voice_client = self.voice_client
+                        break
+                    if resume is not None:
+                        # Same track again, the prepared next one stays prepared
+                        track, offset, attempt = resume
+                        prepared = None
+                    else:
+                        track = self.queue.popleft()
+                        self._record("popleft")
+                        offset, self._resume_at, attempt = self._resume_at, 0.0, 0
+                        prepared, self._prepared = self._prepared, None
+                    resume = None
+                    self._set_state(PlayerState.LOADING)
+
+                if prepared is not None and prepared[0] is track and not offset:
+                    source = prepared[1]
+                else:
+                    if prepared is not None:
+                        prepared[1].cleanup()
+                    try:
+                        if attempt:
+                            # Resolved moments ago, only the ffmpeg process needs replacing
+                            with metrics.timer("musicbot_track_resume_seconds"):
+                                source = await self._create_source(track, offset)
+                        else:
+                            with metrics.timer("musicbot_track_load_seconds"):
+                                track = await self._resolve(track)
+                                source = await self._create_source(track, offset)
+                    except Exception as e:
+                        logger.error(f"Failed to load {track.title}: {e}")
+                        continue
+
+                async with self.lock:
+                    if self.state is not PlayerState.LOADING:
+                        # Stopped while loading, stop() already reset the player
+                        source.cleanup()
+                        return
+                    if not self.voice_client.is_connected():
+                        source.cleanup()
+                        continue
+                    self._finished.clear()
+
+                    def after_play(error, title=track.title):
+                        self._finished_at = time.perf_counter()
+                        metrics.inc("musicbot_after_play_total", error=str(bool(error)).lower())
+                        if error:
+                            logger.error(f"Error playing {title}: {error}")
+                        loop.call_soon_threadsafe(self._finished.set)
+
+                    self._skip_requested = False
+                    try:
+                        self.voice_client.play(source, after=after_play)
+                    except discord.ClientException as e:
+                        logger.error(f"Could not play {track.title} in guild {self.guild_id}: {e}")
+                        source.cleanup()
+                        self.current = None
+                        if not self.voice_client.is_connected():
+                            # Voice dropped, the check at the top of the loop goes idle
+                            continue
+                        # Something else is playing on this connection; stop here, the next /play restarts the loop
+                        self._task = None
+                        self._finished_at = None
+                        self._set_state(PlayerState.IDLE)
+                        self._record("idle")
+                        return
+                    if self._finished_at is not None:
+                        metrics.observe("musicbot_transition_gap_seconds", time.perf_counter() - self._finished_at)
+                        self._finished_at = None
+                    self.current = track
+                    self._started_at = time.monotonic() - offset
+                    self._paused_at = None
+                    self._set_state(PlayerState.PLAYING)
+                    if offset:
+                        self._record("position", round(offset, 1))
+
+                if not attempt:
+                    # A resumed track keeps the on-start work and prefetch of its first attempt
+                    if self._on_track_start is not None:
+                        self._on_track_start(self, track)
+                    self._schedule_prefetch((track.duration or 0) - offset)
+                await self._finished.wait()
+                resume = self._resume_point(track, source, attempt)
+        finally:
+            self._cancel_prefetch()
+
+        if voice_client and voice_client.is_connected():
+            if self._idle_linger:
+                # Stay connected for a while, the next /play skips the voice handshake
+                self.idle_since = time.monotonic()
+            else:
+                await voice_client.disconnect()
+
+    def _resume_point(self, track, source, attempt):
+        # A stream that ended well before the track did broke (ffmpeg exited, connection dropped):
+        # play it again from where it stopped instead of moving on
+        position = getattr(source, "position", None)
+        if self._skip_requested or position is None or not track.duration or attempt >= RESUME_ATTEMPTS:
+            return None
+        if getattr(source, "abandoned", False):
+            # The ffmpeg supervisor already gave up on this stream
+            return None
+        if position >= track.duration - RESUME_MARGIN:
+            return None
+        if attempt and position <= getattr(source, "offset", 0.0) + RESUME_MARGIN:
+            # The last resume got nowhere, the stream URL is probably dead
+            return None
+        logger.warning(f"Stream of {track.title} ended at {position:.1f}s of {track.duration}s, resuming.")
+        metrics.inc("musicbot_track_resumes_total")
+        return track, position, attempt + 1
+
+    # Look-ahead: re-validate the next entry's stream URL and pre-spawn its source
+    def _schedule_prefetch(self, duration):
+        self._cancel_prefetch()
+        if self._lookahead is None:
+            return
+        delay = max(0, (duration or 0) - self._lookahead)
+        self._prefetch_task = asyncio.create_task(self._prefetch_next(delay))
+
+    def _reschedule_prefetch(self):
+        # The head of the queue changed, whatever was prepared belongs to another track now
+        if self.state in (PlayerState.PLAYING, PlayerState.PAUSED) and self.current is not None:
+            self._schedule_prefetch((self.current.duration or 0) - self.position())
+
+    def _cancel_prefetch(self):
+        if self._prefetch_task is not None and self._prefetch_task is not asyncio.current_task():
+            self._prefetch_task.cancel()
+        self._prefetch_task = None
+        if self._prepared is not None:
+            self._prepared[1].cleanup()
+            self._prepared = None
+
+    async def _prefetch_next(self, delay):
+        await asyncio.sleep(delay)
+        while self.state in (PlayerState.PLAYING, PlayerState.PAUSED):
+            if not self.queue:
+                await asyncio.sleep(1)
+                continue
+
+            track = self.queue[0]
+            try:
+                fresh = await self._resolve(track, background=True)
+            except Exception as e:
+                logger.warning(f"Prefetch failed for {track.title}: {e}")
+                return
+
+            # The queue may have changed while we were extracting
+            async with self.lock:
+                if not self.queue or self.queue[0] is not track:
+                    continue
+                self.queue[0] = fresh
+            try:
+                source = await self._create_source(fresh)
+            except Exception as e:
+                logger.warning(f"Prefetch failed for {fresh.title}: {e}")
+                return
+            async with self.lock:
+                if not self.queue or self.queue[0] is not fresh:
+                    source.cleanup()
+                    continue
+                self._prepared = (fresh, source)
+            logger.debug(f"Prepared next track for guild {self.guild_id}: {fresh.title}")
+            return
@@ -0,0 +1,147 @@
+import json
+import sqlite3
+import threading
+import time
+
+from track import Track
+
+YOUTUBE_WATCH_URL = "https://www.youtube.com/watch?v={}"
+
+
+def _entry(track):
+    # Only what is needed to re-resolve the track later, stream URLs expire anyway
+    if track.webpage_url and track.webpage_url != YOUTUBE_WATCH_URL.format(track.id):
+        return [track.id, track.requester, track.webpage_url]
+    return [track.id, track.requester]
+
+
+def entry_track(entry, metadata=None):
+    # Rebuild a Track from a stored entry, using cached metadata when we still have it
+    video_id, requester = entry[0], entry[1]
+    if metadata is not None:
+        return metadata.replace(requester=requester)
+    webpage_url = entry[2] if len(entry) > 2 else YOUTUBE_WATCH_URL.format(video_id)
+    return Track(video_id, webpage_url=webpage_url, requester=requester)
+
+
+def _apply(state, op, data):
+    queue = state["queue"]
+    if op == "extend":
+        queue.extend(data)
+    elif op == "popleft":
+        state["current"] = queue.pop(0) if queue else None
+        state["position"] = 0
+    elif op == "idle":
+        state["current"] = None
+        state["position"] = 0
+    elif op == "clear":
+        queue.clear()
+        state["current"] = None
+        state["position"] = 0
+    elif op == "reset":
+        state["queue"] = list(data)
+        state["current"] = None
+        state["position"] = 0
+    elif op == "reorder":
+        state["queue"] = list(data)
+    elif op == "remove":
+        del queue[data]
+    elif op == "move":
+        queue.insert(data[1], queue.pop(data[0]))
+    elif op == "jump":
+        del queue[:data]
+    elif op == "position":
+        state["position"] = data
+
+
+class QueueStore:
+    """Append-only SQLite journal of queue changes, compacted into per-guild snapshots.
+
+    Players record small operations ("extend", "popleft", ...) as they happen; ``compact``
+    folds the journal into the ``snapshots`` table. Guild queues are only rebuilt when
+    ``load`` is called for them.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "guild_id INTEGER NOT NULL, op TEXT NOT NULL, data TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS journal_guild ON journal (guild_id, seq)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots (guild_id INTEGER PRIMARY KEY, seq INTEGER NOT NULL, "
+            "state TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self.counters = {"records": 0, "compactions": 0, "restored": 0}
+
+    def record(self, guild_id, op, data=None):
+        if op in ("extend", "reset", "reorder"):
+            data = [_entry(track) for track in data]
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT INTO journal (guild_id, op, data) VALUES (?, ?, ?)",
+                (guild_id, op, json.dumps(data))
+            )
+            self._db.commit()
+            self.counters["records"] += 1
+
+    def _replay(self, guild_id):
+        row = self._db.execute("SELECT seq, state FROM snapshots WHERE guild_id = ?", (guild_id,)).fetchone()
+        seq, state = (row[0], json.loads(row[1])) if row else (0, {"current": None, "position": 0, "queue": []})
+        for seq, op, data in self._db.execute(
+            "SELECT seq, op, data FROM journal WHERE guild_id = ? AND seq > ? ORDER BY seq", (guild_id, seq)
+        ):
+            _apply(state, op, json.loads(data))
+        return seq, state
+
+    def load(self, guild_id):
+        # {"current": entry or None, "position": seconds, "queue": [entries]} or None when there is nothing to restore
+        with self._lock:
+            if self._db is None:
+                return None
+            _, state = self._replay(guild_id)
+        if state["current"] is None and not state["queue"]:
+            return None
+        self.counters["restored"] += 1
+        return state
+
+    def compact(self):
+        with self._lock:
+            if self._db is None:
+                return
+            # Shard worker processes share the file, take the write lock before reading what we fold
+            self._db.execute("BEGIN IMMEDIATE")
+            guild_ids = [row[0] for row in self._db.execute("SELECT DISTINCT guild_id FROM journal")]
+            for guild_id in guild_ids:
+                seq, state = self._replay(guild_id)
+                if state["current"] is None and not state["queue"]:
+                    self._db.execute("DELETE FROM snapshots WHERE guild_id = ?", (guild_id,))
+                else:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO snapshots (guild_id, seq, state, stored_at) VALUES (?, ?, ?, ?)",
+                        (guild_id, seq, json.dumps(state), time.time())
+                    )
+                self._db.execute("DELETE FROM journal WHERE guild_id = ? AND seq <= ?", (guild_id, seq))
+            self._db.commit()
+            self.counters["compactions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            if self._db is not None:
+                stats["journal_rows"] = self._db.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+                stats["snapshots"] = self._db.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
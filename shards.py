@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import threading
+import time
+
+import log_pipeline
+import metrics
+import state_feed
+
+logger = logging.getLogger("discord")
+
+PUBLISH_INTERVAL = 1.0
+
+
+def shard_layout(processes, shard_count):
+    # Round-robin shard IDs over the worker processes, e.g. 2 processes / 4 shards -> [0, 2], [1, 3]
+    shard_count = max(shard_count or processes, processes)
+    return shard_count, [list(range(index, shard_count, processes)) for index in range(processes)]
+
+
+def run_shard_worker(index, shard_ids, shard_count, status_queue, command_queue, log_queue, log_level):
+    # Entry point of a shard worker process: its own event loop, extraction pool and subset of guilds
+    root = logging.getLogger("discord")
+    root.handlers.clear()
+    root.addHandler(log_pipeline.TracebackQueueHandler(log_queue))
+    root.setLevel(log_level)
+
+    import bot
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    bot.configure_shards(shard_ids, shard_count)
+    logger.info(f"Shard worker {index} starting with shards {shard_ids} of {shard_count}.")
+
+    async def publish():
+        while True:
+            user = str(bot.bot.user) if bot.bot.user else None
+            user_id = bot.bot.user.id if bot.bot.user else None
+            status_queue.put((index, "status", {
+                "ready": bot.is_ready,
+                "closed": bot.bot.is_closed(),
+                "user": user,
+                "user_id": user_id,
+                "voice_clients": len(bot.bot.voice_clients),
+                "search_cache": dict(bot.SEARCH_CACHE.counters),
+                "extraction": dict(bot.EXTRACTOR.counters),
+                "metrics": metrics.summary(),
+            }))
+            await asyncio.sleep(PUBLISH_INTERVAL)
+
+    def forward_events():
+        # Guild rows only cross the process boundary when they change
+        events = bot.GUILD_FEED.subscribe()
+        while True:
+            status_queue.put((index, "event", events.get()))
+
+    def commands():
+        while True:
+            command, guild_id = command_queue.get()
+            if command == "stop":
+                asyncio.run_coroutine_threadsafe(bot.shutdown(), loop)
+                return
+            asyncio.run_coroutine_threadsafe(bot.guild_command(guild_id, command), loop)
+
+    threading.Thread(target=commands, name=f"ShardCommands-{index}", daemon=True).start()
+    threading.Thread(target=forward_events, name=f"ShardEvents-{index}", daemon=True).start()
+    publisher = loop.create_task(publish())
+    try:
+        loop.run_until_complete(bot.run_bot(loop))
+    finally:
+        publisher.cancel()
+        status_queue.put((index, "status", {"ready": False, "closed": True, "voice_clients": 0}))
+        loop.close()
+
+
+class ShardSupervisor:
+    """Launches shard worker processes and aggregates the state they publish."""
+
+    def __init__(self, processes, shard_count, log_handlers, log_level):
+        self.shard_count, self.layout = shard_layout(processes, shard_count)
+        self.log_level = log_level
+        self._ctx = multiprocessing.get_context("spawn")
+        self._status_queue = self._ctx.Queue()
+        self._log_queue = self._ctx.Queue()
+        self._listener = logging.handlers.QueueListener(self._log_queue, *log_handlers, respect_handler_level=True)
+        self._command_queues = []
+        self._processes = []
+        self.state = {}
+        self.feed = state_feed.GuildStateFeed()
+        self._guild_owner = {}
+
+    def start(self):
+        self._listener.start()
+        for index, shard_ids in enumerate(self.layout):
+            commands = self._ctx.Queue()
+            process = self._ctx.Process(
+                target=run_shard_worker,
+                args=(index, shard_ids, self.shard_count, self._status_queue, commands, self._log_queue, self.log_level),
+                name=f"Shard-{index}",
+            )
+            process.start()
+            self._command_queues.append(commands)
+            self._processes.append(process)
+        logger.info(f"Started {len(self._processes)} shard worker processes for {self.shard_count} shards.")
+
+    def poll(self, timeout=None):
+        # Waits up to ``timeout`` for the first message, then drains whatever else is already queued
+        try:
+            message = self._status_queue.get(timeout=timeout)
+            while True:
+                self._handle_status(*message)
+                message = self._status_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _handle_status(self, index, kind, payload):
+        if kind == "event":
+            self._apply_event(index, payload)
+            return
+        payload["updated"] = time.monotonic()
+        self.state[index] = payload
+        if payload.get("closed"):
+            self._drop_worker_guilds(index)
+
+    def _apply_event(self, index, event):
+        kind, data = event
+        if kind == "snapshot":
+            self._drop_worker_guilds(index, keep={row["guild_id"] for row in data})
+            rows = data
+        elif kind == "update":
+            rows = [data]
+        else:
+            self._guild_owner.pop(data, None)
+            self.feed.remove(data)
+            return
+        for row in rows:
+            self._guild_owner[row["guild_id"]] = index
+            self.feed.update(row)
+
+    def _drop_worker_guilds(self, index, keep=()):
+        for guild_id, owner in list(self._guild_owner.items()):
+            if owner == index and guild_id not in keep:
+                del self._guild_owner[guild_id]
+                self.feed.remove(guild_id)
+
+    def is_alive(self) -> bool:
+        return any(process.is_alive() for process in self._processes)
+
+    def status(self) -> str:
+        if not self.is_alive():
+            return "offline"
+        if len(self.state) < len(self._processes) or not all(state.get("ready") for state in self.state.values()):
+            return "starting"
+        return "online"
+
+    def guild_count(self, index) -> int:
+        return sum(1 for owner in list(self._guild_owner.values()) if owner == index)
+
+    def voice_client_count(self) -> int:
+        return sum(state.get("voice_clients", 0) for state in self.state.values())
+
+    def identity(self):
+        for state in self.state.values():
+            if state.get("user"):
+                return state["user"], state["user_id"]
+        return None, None
+
+    def send(self, guild_id, command):
+        index = self._guild_owner.get(guild_id)
+        if index is None:
+            logger.warning(f"No shard worker owns guild {guild_id}.")
+            return
+        self._command_queues[index].put((command, guild_id))
+
+    def stop(self, timeout=10):
+        for commands in self._command_queues:
+            commands.put(("stop", None))
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not exit in time, terminating.")
+                process.terminate()
+        self._listener.stop()
@@ -0,0 +1,51 @@
+import queue
+import threading
+
+
+class GuildStateFeed:
+    """Latest per-guild state rows plus a stream of changes for other threads.
+
+    The bot loop (or the shard supervisor) calls ``update``/``remove``; every
+    subscriber gets its own ``queue.Queue`` starting with a full snapshot,
+    followed by ("update", row) / ("remove", guild_id) events for changed rows only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._subscribers = []
+
+    def subscribe(self) -> queue.Queue:
+        events = queue.Queue()
+        with self._lock:
+            events.put(("snapshot", list(self._rows.values())))
+            self._subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            if events in self._subscribers:
+                self._subscribers.remove(events)
+
+    def update(self, row):
+        with self._lock:
+            if self._rows.get(row["guild_id"]) == row:
+                return
+            self._rows[row["guild_id"]] = row
+            for events in self._subscribers:
+                events.put(("update", row))
+
+    def remove(self, guild_id):
+        with self._lock:
+            if self._rows.pop(guild_id, None) is None:
+                return
+            for events in self._subscribers:
+                events.put(("remove", guild_id))
+
+    def rows(self):
+        with self._lock:
+            return list(self._rows.values())
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for row in self._rows.values() if row["status"] != "Inactive")
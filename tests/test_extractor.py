@@ -0,0 +1,47 @@
+import asyncio
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import extractor
+
+
+class MutatingYoutubeDL:
+    # Stand-in for yt_dlp.YoutubeDL, which writes into its params dict the same way
+    def __init__(self, params):
+        self.params = params
+        params["compat_opts"] = set()
+
+    def extract_info(self, query, download=False):
+        return {"id": query, "title": query, "url": f"https://example.invalid/{query}"}
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def test_same_options_dict_survives_repeated_extractions(monkeypatch):
+    fake = types.SimpleNamespace(YoutubeDL=MutatingYoutubeDL, utils=types.SimpleNamespace(DownloadError=Exception))
+    monkeypatch.setattr(extractor, "_yt_dlp", lambda: fake)
+    ydl_opts = {"format": "bestaudio", "noplaylist": True}
+
+    async def run():
+        service = extractor.ExtractionService(workers=1, ydl_max_uses=0)
+        try:
+            first = await service.extract_tracks("a", ydl_opts)
+            second = await service.extract_tracks("b", ydl_opts)
+        finally:
+            service.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [track.id for track in first["tracks"]] == ["a"]
+    assert [track.id for track in second["tracks"]] == ["b"]
+    assert ydl_opts == {"format": "bestaudio", "noplaylist": True}
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+discord = pytest.importorskip("discord")
+
+import ffmpeg_supervisor
+
+
+def test_probed_source_is_built_with_our_bitrate(monkeypatch):
+    spawned = []
+
+    async def probe(source, *, method=None, executable=None):
+        return "aac", 128
+
+    def spawn_process(self, args, **kwargs):
+        spawned.append(args)
+        return types.SimpleNamespace(stdout=None, stdin=None, pid=0, returncode=0, poll=lambda: 0, kill=lambda: None)
+
+    monkeypatch.setattr(discord.FFmpegOpusAudio, "probe", staticmethod(probe))
+    monkeypatch.setattr(discord.FFmpegOpusAudio, "_spawn_process", spawn_process)
+
+    source = asyncio.run(ffmpeg_supervisor.probed_opus_audio(
+        "https://example.invalid/audio", 64, executable="ffmpeg", before_options="-ss 5.00", options="-vn"
+    ))
+
+    assert isinstance(source, discord.FFmpegOpusAudio)
+    args = spawned[0]
+    assert args[args.index("-b:a") + 1] == "64k"
+    assert args[args.index("-c:a") + 1] == "libopus"
+    assert "-ss" in args
+    source.cleanup()
+
+
+class LingeringProcess:
+    # Popen stand-in that keeps running until killed and then exits on the next poll
+    pid = 0
+
+    def __init__(self):
+        self.killed = False
+        self.returncode = None
+
+    def poll(self):
+        if self.killed:
+            self.returncode = -9
+        return self.returncode
+
+    def kill(self):
+        self.killed = True
+
+    def wait(self, timeout=None):
+        raise AssertionError("reap must not wait on a process")
+
+
+def test_reap_kills_leftover_process_without_waiting():
+    supervisor = ffmpeg_supervisor.FFmpegSupervisor("ffmpeg")
+    process = LingeringProcess()
+    source = ffmpeg_supervisor.SupervisedSource(supervisor, None, types.SimpleNamespace(cleanup=lambda: None), key=1)
+    source.process = process
+    source.closed = True
+    supervisor._sources.add(source)
+
+    asyncio.run(supervisor.reap())
+    assert process.killed
+    assert supervisor.counters["reaped"] == 1
+    assert source in supervisor._sources
+
+    asyncio.run(supervisor.reap())
+    assert source not in supervisor._sources
+    assert supervisor.counters["reaped"] == 1
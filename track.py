@@ -0,0 +1,89 @@
+import time
+from urllib.parse import urlparse, parse_qs
+
+
+def stream_url_expiry(url, default_ttl=None):
+    # googlevideo URLs carry the signature expiry either as ?expire=<ts> or /expire/<ts>/
+    if not url:
+        return None
+    parsed = urlparse(url)
+    expire = parse_qs(parsed.query).get("expire")
+    if expire:
+        try:
+            return float(expire[0])
+        except ValueError:
+            pass
+    parts = parsed.path.split("/")
+    if "expire" in parts:
+        idx = parts.index("expire")
+        if idx + 1 < len(parts):
+            try:
+                return float(parts[idx + 1])
+            except ValueError:
+                pass
+    if default_ttl is not None:
+        return time.time() + default_ttl
+    return None
+
+
+class Track:
+    """Compact queue entry built from a yt-dlp info dict."""
+
+    __slots__ = ("id", "title", "duration", "thumbnail", "webpage_url", "stream_url", "url_expiry", "acodec", "requester")
+
+    def __init__(self, id, title="Untitled", duration=None, thumbnail=None, webpage_url=None,
+                 stream_url=None, url_expiry=None, acodec=None, requester=None):
+        self.id = id
+        self.title = title
+        self.duration = duration
+        self.thumbnail = thumbnail
+        self.webpage_url = webpage_url
+        self.stream_url = stream_url
+        self.url_expiry = url_expiry
+        self.acodec = acodec
+        self.requester = requester
+
+    @classmethod
+    def from_info(cls, info, requester=None, default_stream_ttl=None):
+        video_id = info.get("id")
+        webpage_url = info.get("webpage_url")
+        stream_url = info.get("url")
+        if info.get("_type") in ("url", "url_transparent"):
+            # Flat playlist entry, "url" points at the watch page rather than the stream
+            webpage_url, stream_url = stream_url, None
+
+        thumbnail = info.get("thumbnail")
+        if thumbnail is None and info.get("thumbnails"):
+            thumbnail = info["thumbnails"][-1].get("url")
+
+        duration = info.get("duration")
+        return cls(
+            video_id,
+            title=info.get("title") or "Untitled",
+            duration=int(duration) if duration else None,
+            thumbnail=thumbnail,
+            webpage_url=webpage_url or f"https://www.youtube.com/watch?v={video_id}",
+            stream_url=stream_url,
+            url_expiry=stream_url_expiry(stream_url, default_stream_ttl),
+            acodec=info.get("acodec") if stream_url else None,
+            requester=requester,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{slot: data.get(slot) for slot in cls.__slots__})
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def replace(self, **changes):
+        data = self.to_dict()
+        data.update(changes)
+        return Track(**data)
+
+    @property
+    def is_resolved(self) -> bool:
+        return self.stream_url is not None
+
+    def __repr__(self):
+        return f"<Track id={self.id!r} title={self.title!r}>"
@@ -0,0 +1,208 @@
+import random
+from collections import Counter
+
+
+class TrackQueue:
+    """Blocked list of Tracks with positional operations, an ID index and a version counter.
+
+    Tracks live in blocks of at most ``2 * BLOCK`` items; a Fenwick tree over the block
+    lengths finds the block holding a position in O(log n), so remove/insert/move by
+    position don't shift the whole queue. ``version`` changes on every mutation so
+    rendered views can be cached against it, and ``duration`` is adjusted as tracks
+    come and go instead of being re-summed.
+    """
+
+    BLOCK = 64
+
+    def __init__(self, tracks=()):
+        self._blocks = []
+        self._tree = None  # Fenwick tree over len(block), rebuilt lazily after blocks are split/dropped
+        self._len = 0
+        self._ids = Counter()
+        self.version = 0
+        self.duration = 0
+        self.unknown_durations = 0  # tracks without a known length, e.g. unresolved playlist stubs
+        self.extend(tracks)
+
+    # Bookkeeping
+    def _added(self, track):
+        self._len += 1
+        self._ids[track.id] += 1
+        if track.duration:
+            self.duration += track.duration
+        else:
+            self.unknown_durations += 1
+
+    def _removed(self, track):
+        self._len -= 1
+        self._ids[track.id] -= 1
+        if not self._ids[track.id]:
+            del self._ids[track.id]
+        if track.duration:
+            self.duration -= track.duration
+        else:
+            self.unknown_durations -= 1
+
+    # Block index
+    def _build_tree(self):
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, block_index, delta):
+        if self._tree is None:
+            return
+        i = block_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _locate(self, index):
+        # Position -> (block index, offset in block)
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("queue index out of range")
+        if self._tree is None:
+            self._build_tree()
+        position = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = position + step
+            if nxt < len(self._tree) and self._tree[nxt] <= index:
+                position = nxt
+                index -= self._tree[nxt]
+            step >>= 1
+        return position, index
+
+    def _drop_block_if_empty(self, block_index):
+        if not self._blocks[block_index]:
+            del self._blocks[block_index]
+            self._tree = None
+
+    # Deque-style operations, O(1) amortized
+    def append(self, track):
+        if not self._blocks or len(self._blocks[-1]) >= self.BLOCK:
+            self._blocks.append([])
+            self._tree = None
+        self._blocks[-1].append(track)
+        self._tree_add(len(self._blocks) - 1, 1)
+        self._added(track)
+        self.version += 1
+
+    def extend(self, tracks):
+        for track in tracks:
+            self.append(track)
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError("pop from an empty queue")
+        track = self._blocks[0].pop(0)
+        self._tree_add(0, -1)
+        self._drop_block_if_empty(0)
+        self._removed(track)
+        self.version += 1
+        return track
+
+    def clear(self):
+        self._blocks = []
+        self._tree = None
+        self._len = 0
+        self._ids.clear()
+        self.duration = 0
+        self.unknown_durations = 0
+        self.version += 1
+
+    # Positional operations, O(log n + BLOCK)
+    def insert(self, index, track):
+        if index >= self._len:
+            self.append(track)
+            return
+        block_index, offset = self._locate(max(index, 0))
+        block = self._blocks[block_index]
+        block.insert(offset, track)
+        self._tree_add(block_index, 1)
+        if len(block) > 2 * self.BLOCK:
+            self._blocks[block_index:block_index + 1] = [block[:self.BLOCK], block[self.BLOCK:]]
+            self._tree = None
+        self._added(track)
+        self.version += 1
+
+    def pop(self, index):
+        block_index, offset = self._locate(index)
+        track = self._blocks[block_index].pop(offset)
+        self._tree_add(block_index, -1)
+        self._drop_block_if_empty(block_index)
+        self._removed(track)
+        self.version += 1
+        return track
+
+    def move(self, source, destination):
+        track = self.pop(source)
+        self.insert(destination, track)
+        return track
+
+    def drop_front(self, count):
+        # Removes and returns the first ``count`` tracks, whole blocks at a time
+        removed = []
+        while self._blocks and len(removed) < count:
+            block = self._blocks[0]
+            take = min(len(block), count - len(removed))
+            removed.extend(block[:take])
+            del block[:take]
+            if not block:
+                del self._blocks[0]
+        self._tree = None
+        for track in removed:
+            self._removed(track)
+        self.version += 1
+        return removed
+
+    def shuffle(self):
+        tracks = list(self)
+        random.shuffle(tracks)
+        self._blocks = [tracks[i:i + self.BLOCK] for i in range(0, len(tracks), self.BLOCK)]
+        self._tree = None
+        self.version += 1
+
+    def contains(self, video_id) -> bool:
+        return video_id in self._ids
+
+    def slice(self, start, stop):
+        # Starts at the block holding ``start``, used to render one page of a long queue
+        start, stop = max(start, 0), min(stop, self._len)
+        if start >= stop:
+            return []
+        block_index, offset = self._locate(start)
+        items = []
+        while len(items) < stop - start:
+            block = self._blocks[block_index]
+            items.extend(block[offset:offset + stop - start - len(items)])
+            block_index, offset = block_index + 1, 0
+        return items
+
+    def __getitem__(self, index):
+        block_index, offset = self._locate(index)
+        return self._blocks[block_index][offset]
+
+    def __setitem__(self, index, track):
+        block_index, offset = self._locate(index)
+        block = self._blocks[block_index]
+        self._removed(block[offset])
+        block[offset] = track
+        self._added(track)
+        self.version += 1
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block